@@ -0,0 +1,235 @@
+"""
+Analyses du programme, sur l'AST ou sur le code assembleur produit par le compilateur.
+
+Utilisation :
+>>> import analyse
+>>> analyse.est_pure("f", ["a", "b"], corps, visibles, pures)
+>>> profondeur, profondeurs, recursives = analyse.profondeur_pile(interprete_asm.decode(asm), compile.entrees)
+>>> taille = analyse.taille_memoire(interprete_asm.decode(asm), compile.entrees)
+"""
+
+import interprete_asm
+
+
+# Fonctions pures : une fonction est pure si son résultat ne dépend que de ses arguments et si elle n'a aucun effet
+# visible de l'extérieur. On peut alors réutiliser le résultat d'un appel précédent avec les mêmes arguments !
+# Concrètement, son corps ne doit :
+# - rien afficher,
+# - ni lire ni modifier une variable qui n'est pas locale (globale ou appartenant à une fonction englobante),
+# - appeler que des fonctions pures (ou elle-même).
+# Attention, comme dans compile.py, une variable affectée dans la fonction n'est locale que si elle n'existait pas
+# déjà au moment de la déclaration : sinon, on modifie la variable extérieure !
+
+def est_pure(nom, args, corps, visibles, pures):
+    """
+    nom, args, corps : la déclaration de la fonction
+    visibles : les noms de variables qui existent au moment de la déclaration
+    pures : les noms des fonctions déjà connues comme pures
+    """
+    return pure(corps, nom, set(args), visibles, pures)
+
+def pure(ast, nom, locales, visibles, pures):
+    type = ast[0]
+    if type == "AFFICHER":
+        return False
+    elif type in ("PLUS", "MOINS", "FOIS", "EGALE"):
+        return pure(ast[1], nom, locales, visibles, pures) and pure(ast[2], nom, locales, visibles, pures)
+    elif type == "ENTIER":
+        return True
+    elif type == "BLOC":
+        return all(pure(a, nom, locales, visibles, pures) for a in ast[1])
+    elif type == "AFFECTATION":
+        if not pure(ast[2], nom, locales, visibles, pures):
+            return False
+        if ast[1] not in locales:
+            if ast[1] in visibles:
+                return False
+            locales.add(ast[1])
+        return True
+    elif type == "VARIABLE":
+        return ast[1] in locales
+    elif type == "CONDITION":
+        return pure(ast[1], nom, locales, visibles, pures) and pure(ast[2], nom, locales, visibles, pures)
+    elif type == "FONCTION":
+        # Une déclaration ne fait rien à l'exécution : la fonction déclarée est analysée de son côté.
+        return True
+    elif type == "RENVOYER":
+        return pure(ast[1], nom, locales, visibles, pures)
+    elif type == "APPEL":
+        if ast[1] != nom and ast[1] not in pures:
+            return False
+        return all(pure(a, nom, locales, visibles, pures) for a in ast[2])
+    return False
+
+
+# Profondeur de pile : la mémoire contient les variables globales, puis la pile. Quelle taille lui faut-il ?
+# Pour le savoir sans exécuter le programme, on suit toutes les exécutions possibles en ne retenant que ce que l'on
+# peut connaître à la compilation : les constantes dans les registres, et la position de rsp par rapport au début de
+# la fonction. Il n'y a pas de boucle dans le langage : les seuls sauts en arrière sont les appels de fonctions.
+# A chaque appel, on ajoute la profondeur de la fonction appelée (calculée une seule fois) à la position de rsp.
+# Si une fonction s'appelle elle-même (même indirectement), la profondeur dépend des arguments : on abandonne.
+# Un saut n'est reconnu comme un appel que s'il va au début d'une fonction : il faut donc connaître l'adresse de
+# toutes les fonctions, même de celles qui ont été redéfinies ou qui portent le même nom qu'une autre. Par prudence,
+# on abandonne aussi si l'on tombe sur un retour qui ne dépile pas l'adresse de retour de la fonction en cours (ou
+# sur n'importe quel retour en dehors d'une fonction) : c'est qu'on est entré quelque part sans reconnaître l'appel.
+#
+# Une valeur connue est de la forme :
+# - ("n", 12)   : la constante 12
+# - ("pile", 3) : la valeur de rsp au début de la fonction, plus 3
+# et None si on ne la connaît pas.
+
+def profondeur_pile(programme, entrees, limite=65536):
+    """
+    programme : liste d'instructions décodées (voir interprete_asm.decode())
+    entrees : nom de la fonction à chaque adresse, pour toutes les fonctions (comme compile.entrees)
+    Renvoie :
+    - la taille de mémoire nécessaire au programme (variables globales comprises), ou None si on ne sait pas la borner,
+    - la profondeur de pile de la fonction à chaque adresse (adresse de retour comprise), ou None,
+    - les noms des fonctions récursives.
+    """
+    etat = etat_initial(programme, entrees, limite)
+    profondeur = profondeur_programme(etat)
+
+    profondeurs = {}
+    for adresse in entrees:
+        profondeurs[adresse] = profondeur_fonction(adresse, etat)
+    return profondeur, profondeurs, {entrees[adresse] for adresse in etat["recursives"]}
+
+def taille_memoire(programme, entrees, limite=65536):
+    """
+    Seulement la taille de mémoire nécessaire au programme, ou None (voir profondeur_pile()).
+    Les fonctions qui ne sont jamais appelées ne sont pas analysées.
+    """
+    return profondeur_programme(etat_initial(programme, entrees, limite))
+
+def etat_initial(programme, entrees, limite):
+    return {
+        "programme": programme,
+        "entrees": entrees,
+        "profondeurs": {},  # profondeurs[adresse] : profondeur de la fonction à cette adresse
+        "en_cours": [],  # adresses des fonctions en cours d'analyse
+        "recursives": set(),
+        "limite": limite,
+    }
+
+def profondeur_programme(etat):
+    """Profondeur atteinte depuis le début du programme, où tous les registres valent 0."""
+    registres = {reg: ("n", 0) for reg in interprete_asm.noms_registres}
+    registres["rsp"] = "pile", 0
+    return profondeur_depuis(0, registres, etat, dans_fonction=False)
+
+def profondeur_fonction(adresse, etat):
+    if adresse in etat["en_cours"]:
+        # Récursivité : toutes les fonctions entre le premier appel et celui-ci sont récursives.
+        etat["recursives"].update(etat["en_cours"][etat["en_cours"].index(adresse):])
+        return None
+    if adresse not in etat["profondeurs"]:
+        etat["en_cours"].append(adresse)
+        # Au début de la fonction, rsp est juste après l'adresse de retour, et on ne connaît aucun registre.
+        registres = {reg: None for reg in interprete_asm.noms_registres}
+        registres["rsp"] = "pile", 0
+        profondeur = profondeur_depuis(adresse, registres, etat, dans_fonction=True)
+        etat["en_cours"].pop()
+        etat["profondeurs"][adresse] = profondeur
+    return etat["profondeurs"][adresse]
+
+def profondeur_depuis(debut, registres, etat, dans_fonction):
+    """
+    Profondeur maximale atteinte par rsp, par rapport à sa valeur au début.
+    dans_fonction : si l'on part du début d'une fonction (un retour est alors attendu), ou du début du programme.
+    """
+    programme = etat["programme"]
+    maximum = 0
+    a_visiter = [(debut, registres)]
+    vus = set()
+    while a_visiter:
+        rip, registres = a_visiter.pop()
+        cle = rip, tuple(sorted(registres.items()))
+        if cle in vus or rip >= len(programme):
+            continue
+        vus.add(cle)
+
+        rsp = registres["rsp"]
+        if rsp is None or rsp[0] != "pile":
+            return None
+        maximum = max(maximum, rsp[1])
+        if maximum > etat["limite"]:
+            return None
+
+        dest, op, source = programme[rip]
+        registres = dict(registres)
+        suivants = [rip + 1]
+        appel = None  # adresse de la fonction appelée, et position de rsp à son début
+
+        if op == "const":
+            registres[dest] = "n", source
+        elif op == "copy":
+            registres[dest] = ("n", rip) if source == "rip" else registres[source]
+        elif op in ("add", "sub", "mul"):
+            registres[dest] = calcule(op, registres[dest], registres[source])
+        elif op == "load":
+            if dest == "rip":
+                if not dans_fonction or registres[source] != ("pile", -1):
+                    return None # Retour d'un appel que l'on n'a pas reconnu : on ne sait pas où l'on va
+                continue # Retour de fonction
+            registres[dest] = None
+        elif op == "addinz":
+            saut = registres[source]
+            if saut is None or saut[0] != "n":
+                return None
+            if registres[dest] != ("n", 0):
+                suivants = [rip + 1 + saut[1]] if registres[dest] is not None else [rip + 1, rip + 1 + saut[1]]
+        elif op == "push":
+            registres["rsp"] = "pile", rsp[1] + 1
+        elif op == "pop":
+            if source == "rip":
+                return None # Retour par pop : le compilateur n'en produit pas
+            registres["rsp"] = "pile", rsp[1] - 1
+            registres[source] = None
+        elif op == "call":
+            appel = source, rsp[1] + 1
+        elif op == "ret":
+            if not dans_fonction or rsp != ("pile", 0):
+                return None
+            continue
+
+        if dest == "rip" and op != "addinz":
+            cible = registres["rip"]
+            if cible is None or cible[0] != "n":
+                return None
+            if cible[1] + 1 in etat["entrees"]:
+                # Saut vers une fonction : l'adresse de retour est déjà sur la pile, et sera dépilée au retour.
+                appel = cible[1] + 1, rsp[1]
+                registres["rsp"] = "pile", rsp[1] - 1
+            else:
+                suivants = [cible[1] + 1]
+
+        if appel is not None:
+            adresse, position = appel
+            profondeur = profondeur_fonction(adresse, etat)
+            if profondeur is None:
+                return None
+            maximum = max(maximum, position + profondeur)
+            # La fonction appelée n'a gardé aucun registre à part rbp et rsp.
+            for reg in registres:
+                if reg not in ("rsp", "rbp"):
+                    registres[reg] = None
+
+        for suivant in suivants:
+            a_visiter.append((suivant, registres))
+    return maximum
+
+def calcule(op, a, b):
+    if a is None or b is None:
+        return None
+    if op == "add" and a[0] == "n":
+        return (b[0], a[1] + b[1]) if b[0] == "n" or b[0] == "pile" else None
+    if op == "add" and b[0] == "n":
+        return a[0], a[1] + b[1]
+    if op == "sub" and b[0] == "n":
+        return a[0], a[1] - b[1]
+    if op == "sub" and a[0] == b[0] == "pile":
+        return "n", a[1] - b[1]
+    if op == "mul" and a[0] == b[0] == "n":
+        return "n", a[1] * b[1]
+    return None
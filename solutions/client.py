@@ -0,0 +1,78 @@
+"""
+Client du serveur de compilation (voir serveur.py).
+Utilisation, une fois le serveur lancé :
+python client.py p1.code p2.code
+python client.py p1.code --action compile --registres
+python client.py p1.code --json
+
+Pour chaque fichier, le client envoie le programme au serveur, et affiche ce qu'il a affiché (ou son code assembleur
+avec --action compile, ou son AST avec --action parse). Avec --json, il affiche directement les réponses du serveur.
+Ce fichier n'importe volontairement rien du compilateur : c'est tout l'intérêt !
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+
+
+SOCKET_PAR_DEFAUT = os.path.join("/tmp", "ipt-{}.sock".format(os.getuid()))
+
+
+def envoie(requetes, chemin_socket=SOCKET_PAR_DEFAUT):
+    """
+    Envoie les requêtes au serveur sur une seule connexion, et renvoie ses réponses dans le même ordre.
+    Une requête est un dictionnaire : {"programme": "...", "action": "execution", "optimise": False, "registres": False}
+    (seul le programme est obligatoire, voir serveur.traite_requete()).
+    """
+    # On lit chaque réponse avant d'envoyer la requête suivante. Envoyer toutes les requêtes d'abord bloquerait :
+    # le serveur écrit chaque réponse dès qu'elle est prête, et s'arrête quand la socket est pleine faute de lecteur,
+    # pendant que le client attend de pouvoir écrire la suite.
+    reponses = []
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connexion:
+        connexion.connect(chemin_socket)
+        with connexion.makefile('r', encoding='utf-8') as lecture, connexion.makefile('w', encoding='utf-8') as ecriture:
+            for requete in requetes:
+                ecriture.write(json.dumps(requete, ensure_ascii=False) + '\n')
+                ecriture.flush()
+                ligne = lecture.readline()
+                if not ligne:
+                    raise RuntimeError("Le serveur a fermé la connexion")
+                reponses.append(json.loads(ligne))
+    return reponses
+
+
+def main(arguments=None):
+    options = argparse.ArgumentParser(description="Envoie des fichiers .code au serveur de compilation.")
+    options.add_argument('fichiers', nargs='+', help="fichiers .code")
+    options.add_argument('--action', choices=["parse", "compile", "execution"], default="execution")
+    options.add_argument('--optimise', action='store_true', help="optimise l'AST avant de compiler")
+    options.add_argument('--registres', action='store_true', help="passe les arguments dans les registres")
+    options.add_argument('--json', action='store_true', help="affiche les réponses JSON du serveur")
+    options.add_argument('--socket', default=SOCKET_PAR_DEFAUT, help="chemin de la socket du serveur")
+    options = options.parse_args(arguments)
+
+    requetes = []
+    for chemin in options.fichiers:
+        with open(chemin) as f:
+            requetes.append({"programme": f.read(), "action": options.action,
+                             "optimise": options.optimise, "registres": options.registres})
+
+    erreurs = 0
+    for chemin, reponse in zip(options.fichiers, envoie(requetes, options.socket)):
+        if options.json:
+            print(json.dumps(dict({"fichier": chemin}, **reponse), ensure_ascii=False))
+            continue
+        print(reponse["sortie"], end='')
+        if options.action == "parse":
+            print(json.dumps(reponse.get("ast")))
+        elif options.action == "compile":
+            print(reponse.get("asm", ""), end='')
+        if reponse["erreur"] is not None:
+            erreurs += 1
+            print("{} : {}".format(chemin, reponse["erreur"]), file=sys.stderr)
+    return 1 if erreurs else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
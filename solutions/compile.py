@@ -17,9 +17,19 @@ en informatique, il est trop tard pour changer !)
 Après un appel de fonction, rax contient la valeur de retour.
 rbp est utilisé pour accéder aux arguments dans le code d'une fonction.
 (voir compile_fonction() pour le détail)
+
+Avec compile(ast, registres=True), les trois premiers arguments sont passés dans les registres rsi, rdi et rdx
+(voir compile_appel() pour le détail).
+
+Une instruction peut contenir une adresse relative '@+k' : elle désigne l'instruction située k lignes plus loin,
+et est remplacée par sa vraie adresse à la fin de la compilation (voir resout_adresses()).
 """
 
+import re
+
 import parser
+import analyse
+import optimisations
 
 
 # Variables : si globales, allouées tout en bas de la pile au début du programme ;
@@ -27,35 +37,67 @@ import parser
 # L'adresse d'une variable peut être de deux formes différentes :
 # - "absolue",  12 : variable globale stockée à l'adresse 12
 # - "relative", -3 : variable locale stockée à l'adresse 'valeur de rbp' - 3
-
-variables = {}  # variables["x"] contient l'addresse en mémoire de x
-dans_une_fonction = False
+# Avec la convention d'appel par registres, un argument peut aussi être de la forme :
+# - "registre", "rsi" : argument stocké dans le registre rsi
+# Enfin, une fonction déclarée dans une autre peut utiliser les variables de celle-ci (comme x dans g, dans p7.code) :
+# - "englobante", (2, -3) : variable locale stockée à l'adresse -3 par rapport au rbp de la fonction deux niveaux
+#   au-dessus (voir compile_fonction() pour savoir comment on le retrouve)
+#
+# Les noms sont rangés dans une pile de portées : portees[0] contient les variables globales, et chaque fonction en
+# cours de compilation y ajoute la sienne (ses arguments et ses variables locales), qu'elle enlève à la fin.
+# Une variable est cherchée de la portée la plus récente à la plus ancienne : les variables visibles dans une
+# fonction sont donc bien celles qui existaient au moment de sa déclaration, sans avoir à les recopier.
+
+variables = {}  # variables["x"] contient l'addresse en mémoire de la variable globale x
+portees = [variables]
 adresse_globale_libre = 0
-adresse_locale_libre = 0
+adresse_locale_libre = 0  # dans la fonction en cours de compilation
 
 def nouvelle_variable(nom):
     """Retourne une adresse libre pour la nouvelle variable"""
     global adresse_globale_libre, adresse_locale_libre
 
-    if dans_une_fonction:
+    if len(portees) > 1:
         # Variable locale
         adresse = adresse_locale_libre
         adresse_locale_libre += 1
-        variables[nom] = "relative", adresse
+        portees[-1][nom] = "relative", adresse
     else :
         # Variable globale
         adresse = adresse_globale_libre
         adresse_globale_libre += 1
         variables[nom] = "absolue", adresse
 
-    return variables[nom]
+    return portees[-1][nom]
+
+def cherche_variable(nom):
+    """Retourne l'adresse de la variable visible de ce nom, ou None s'il n'y en a pas"""
+    for i in range(len(portees) - 1, -1, -1):
+        if nom in portees[i]:
+            if 0 < i < len(portees) - 1:
+                # Variable d'une fonction englobante : elle est forcément sur la pile (voir compile_fonction())
+                return "englobante", (len(portees) - 1 - i, portees[i][nom][1])
+            return portees[i][nom]
+    return None
 
 def adresse_variable(nom):
     # Crée une nouvelle variable si besoin
-    if nom in variables:
-        return variables[nom]
+    adresse = cherche_variable(nom)
+    if adresse is not None:
+        return adresse
     return nouvelle_variable(nom)
 
+def adresse_dans_rbx(type, adr):
+    """Met l'adresse en mémoire d'une variable dans rbx (attention, utilise aussi rcx)"""
+    if type == "absolue":
+        return "rbx <- const {}\n".format(adr)
+    if type == "relative":
+        # L'adresse est par rapport à rbp, il faut donc l'ajouter pour obtenir la vraie adresse.
+        return "rbx <- const {}\n".format(adr) + "rbx <- add rbp\n"
+    # On remonte les liens statiques jusqu'au rbp de la bonne fonction, puis on ajoute l'adresse relative.
+    sauts, adr = adr
+    return "rbx <- copy rbp\n" + "rbx <- load (rbx)\n" * sauts + "rcx <- const {}\n".format(adr) + "rbx <- add rcx\n"
+
 
 # Fonctions : leur code sera entre l'allocation des variables et le point d'entrée du programme.
 # On ne peut pas placer les fonctions tout en haut, on ne commence pas par les exécuter !
@@ -76,26 +118,77 @@ def adresse_variable(nom):
 # ...
 
 fonctions = {}  # fonctions["f"] contient l'adresse du code de f
+entrees = {}  # entrees[adresse] contient le nom de la fonction à cette adresse (même redéfinie depuis)
+fonctions_englobantes = {}  # pour une fonction déclarée dans une autre : la portée de celle-ci (voir compile_lien())
+fonctions_masquees = []  # pour chaque corps de fonction en cours : ce que masquent les fonctions qui y sont déclarées
+fonctions_pures = {}  # fonctions_pures[adresse] contient le nombre d'arguments de la fonction pure à cette adresse
+noms_pures = set()  # noms des fonctions pures (celles dont l'adresse actuelle est dans fonctions_pures)
 code_fonctions = ""  # contient le code de toutes les fonctions dans l'ordre
 adresse_fonction_libre = 3  # instructions 0 et 1 pour allouer les variables, 2 pour sauter au point d'entrée
 
+# Convention d'appel par registres (voir compile_appel_registres())
+convention_registres = False
+registres_arguments = ["rsi", "rdi", "rdx"]
+registres_sauves = []  # registres contenant les arguments de la fonction en cours
+registres_vivants = {}  # registres_vivants[id(args)] : registres encore lus après l'appel d'arguments args
+
+# Compilation séparée (voir edition.py) : chaque fonction est compilée à part, sans savoir où elle sera placée.
+# Son adresse est alors un symbole : fonctions["f"] contient par exemple "f.1/f", et les appels contiennent
+# l'adresse symbolique '@f.1/f' (ou '@f.1/f-1'), que l'éditeur de liens remplacera par la vraie adresse.
+prefixe_symboles = None  # préfixe des symboles en compilation séparée, None sinon
+symboles = {}  # symboles["f.1/f"] contient la position de la fonction dans code_fonctions
+
+def nouveau_symbole(nom):
+    symbole = (prefixe_symboles or "") + nom
+    while symbole in symboles:
+        symbole += "'"
+    symboles[symbole] = None # La position sera connue une fois la fonction compilée
+    return symbole
+
+def adresse_fonction(nom, decalage=0):
+    """Adresse de la fonction nom, plus decalage (ou son adresse symbolique en compilation séparée)."""
+    if nom not in fonctions:
+        raise RuntimeError("Fonction inconnue : {}".format(nom))
+    adresse = fonctions[nom]
+    if type(adresse) == str:
+        return "@{}{:+d}".format(adresse, decalage) if decalage else "@" + adresse
+    return adresse + decalage
+
 def nouvelle_fonction(nom, code):
     global adresse_fonction_libre, code_fonctions
 
     adresse = adresse_fonction_libre
-    fonctions[nom] = adresse
+    symbole = fonctions[nom]
+    if prefixe_symboles is None:
+        fonctions[nom] = adresse
+        entrees[adresse] = nom
+    else:
+        symboles[symbole] = adresse
+        entrees[symbole] = nom # Remplacé par la vraie adresse à l'édition de liens (voir edition.lie())
 
     adresse_fonction_libre += code.count('\n') # La prochaine fonction sera située après celle-ci
     code_fonctions += code
 
+    if prefixe_symboles is None and type(symbole) == str:
+        # Adresse provisoire (voir compile_fonction()) : on met la vraie dans les appels déjà compilés.
+        code_fonctions = re.sub(r"@{}(-1)?$".format(re.escape(symbole)),
+                                lambda m: str(adresse + int(m.group(1) or 0)), code_fonctions, flags=re.M)
+
 
 # Fonctions auxiliaires pour gérer la pile.
 # Attention : elles modifient le registre rcx ! Evitez de l'utiliser quand vous devez manipuler la pile !
+# Avec le jeu d'instructions étendu (compile(ast, etendu=True)), ce sont simplement les instructions push et pop.
+
+jeu_etendu = False
 
 def empile(reg):
+    if jeu_etendu:
+        return "push {}\n".format(reg)
     return "(rsp) <- store {}\n".format(reg) + "rcx <- const 1\n" + "rsp <- add rcx\n"
 
 def depile(reg):
+    if jeu_etendu:
+        return "pop {}\n".format(reg)
     return "rcx <- const 1\n" + "rsp <- sub rcx\n" + "{} <- load (rsp)\n".format(reg)
 
 
@@ -175,23 +268,21 @@ def compile_affectation(var, ast):
     type, adr = adresse_variable(var)
 
     val_dans_rax = compile_ast(ast) + depile("rax")
+    if type == "registre":
+        return val_dans_rax + "{} <- copy rax\n".format(adr)
 
-    adr_dans_rbx = "rbx <- const {}\n".format(adr)
-    if type == "relative":
-        # L'adresse est par rapport à rbp, il faut donc l'ajouter pour obtenir la vraie adresse.
-        adr_dans_rbx += "rbx <- add rbp\n"
-
-    return val_dans_rax + adr_dans_rbx + "(rbx) <- store rax\n"
+    return val_dans_rax + adresse_dans_rbx(type, adr) + "(rbx) <- store rax\n"
 
 def compile_variable(var):
-    # Ici var doit déjà être définie. Sinon, cela va planter !
-    type, adr = variables[var]
-
-    adr_dans_rbx = "rbx <- const {}\n".format(adr)
-    if type == "relative":
-        adr_dans_rbx += "rbx <- add rbp\n"
+    # Ici var doit déjà être définie.
+    adresse = cherche_variable(var)
+    if adresse is None:
+        raise RuntimeError("Variable inconnue : {}".format(var))
+    type, adr = adresse
+    if type == "registre":
+        return empile(adr)
 
-    return adr_dans_rbx + "rax <- load (rbx)\n" + empile("rax")
+    return adresse_dans_rbx(type, adr) + "rax <- load (rbx)\n" + empile("rax")
 
 def compile_condition(si, alors):
     code_si = compile_ast(si)
@@ -208,7 +299,7 @@ def compile_egale(ast1, ast2):
     return compile_ast(ast1) + compile_ast(ast2) + depile("rax") + depile("rbx") + "rax <- sub rbx\n" + empile("rax")
 
 def compile_fonction(nom, args, code):
-    global dans_une_fonction, adresse_locale_libre, variables
+    global adresse_locale_libre, registres_sauves
     """
     Etat de la pile (le plus ancien en bas, le plus récent en haut), n'importe quand dans le corps de la fonction :
     
@@ -219,6 +310,7 @@ def compile_fonction(nom, args, code):
     .
     .
     argument n
+    (lien statique)
     adresse de retour
     ancien rbp
     variable locale 1  <--- rbp
@@ -231,6 +323,14 @@ def compile_fonction(nom, args, code):
     
     Cet espace libre va bientôt être rempli par des résultats intermédiaires, et rsp va être modifié,
     ce qui explique pourquoi on a besoin de le sauvegarder maintenant pour pouvoir retrouver les arguments.
+
+    Une fonction déclarée dans une autre fonction (g dans f) peut lire et modifier les variables de f : il faut donc
+    qu'elle sache où est la pile de f. L'appelant le lui donne comme un argument en plus, le lien statique : le rbp
+    de f (voir compile_lien()). Ce n'est pas forcément le rbp de l'appelant, puisque g peut être appelée par
+    elle-même, ou par une autre fonction déclarée dans f. g range ce lien dans sa première variable locale (à
+    l'adresse rbp) : depuis une fonction déclarée dans g, on retrouve alors f en suivant deux liens.
+    Avec la convention par registres, les variables de f doivent être sur la pile : si f déclare des fonctions,
+    elle recopie ses arguments dans des variables locales.
     """
 
     # Avant toute chose, on sauvegarde l'ancien rbp, puisqu'on s'apprête à le modifier.
@@ -239,39 +339,168 @@ def compile_fonction(nom, args, code):
     # Ensuite on sauvegarde rsp dans rbp.
     sauvegarde_rsp = "rbp <- copy rsp\n"
 
-    # Avant de compiler le corps de la fonction, on rajoute les arguments dans l'environnement,
-    # et on enregistre qu'on est dans une fonction (car alors les nouvelles variables sont locales à la fonction).
-    dans_une_fonction = True
-    variables_copie = variables.copy()
-    adr_arg = -2 - len(args) # le premier argument est tout en bas !
+    # Avant de compiler le corps de la fonction, on ajoute une nouvelle portée pour les arguments et les variables
+    # locales (et on pense à remettre celle de la fonction englobante comme elle était à la fin).
+    englobante = portees[-1] if len(portees) > 1 else None
+    portees.append({})
+
+    # De même, une fonction déclarée dans une autre ne masque celle de même nom que dans le corps englobant :
+    # on retient ce qu'elle masque pour le remettre à la fin de ce corps (voir restaure_fonctions()).
+    if fonctions_masquees:
+        fonctions_masquees[-1].setdefault(nom, (fonctions.get(nom), fonctions_englobantes.get(nom), nom in noms_pures))
+    fonctions_masquees.append({})
+    adresse_locale_libre_copie = adresse_locale_libre
+    adresse_locale_libre = 0
+    nb_args = len(args) + (englobante is not None)
+    adr_arg = -2 - nb_args # le premier argument est tout en bas !
     for arg in args:
-        variables[arg] = "relative", adr_arg
+        portees[-1][arg] = "relative", adr_arg
         adr_arg += 1
-    # La prochaine adresse locale libre pour une nouvelle variable est donc à rbp pile
-    adresse_locale_libre = 0
-    # On se souvient du nombre de variables pour savoir combien il y en a de nouvelles (locales).
-    num_variables = len(variables)
-    # Enfin, on rajoute la fonction en cours dans l'environnement en cas de récursivité
-    fonctions[nom] = adresse_fonction_libre
+
+    # Le lien statique, s'il y en a un, est le dernier argument : on le range dans la première variable locale.
+    range_lien = ""
+    if englobante is not None:
+        if convention_registres and nb_args <= len(registres_arguments):
+            lien = registres_arguments[len(args)]
+        else:
+            lien = "rax"
+            range_lien = "rbx <- const -3\n" + "rbx <- add rbp\n" + "rax <- load (rbx)\n"
+        range_lien += "(rbp) <- store {}\n".format(lien)
+        adresse_locale_libre = 1
+
+    # Avec la convention par registres, les premiers arguments sont dans les registres (leur case sur la pile,
+    # s'il y en a une, n'est plus utilisée). L'appelant devra sauvegarder ces registres avant ses propres appels.
+    registres_sauves_copie = registres_sauves
+    range_args = ""
+    if convention_registres:
+        registres_sauves = registres_arguments[:len(args)]
+        for arg, reg in zip(args, registres_sauves):
+            portees[-1][arg] = "registre", reg
+        if declare_des_fonctions(code):
+            for arg, reg in zip(args, registres_sauves):
+                range_args += adresse_dans_rbx("relative", adresse_locale_libre) + "(rbx) <- store {}\n".format(reg)
+                portees[-1][arg] = "relative", adresse_locale_libre
+                adresse_locale_libre += 1
+            registres_sauves = []
+        else:
+            note_registres_vivants(code, dict(zip(args, registres_sauves)))
+
+    # Enfin, on rajoute la fonction en cours dans l'environnement en cas de récursivité.
+    # Si elle déclare d'autres fonctions, leur code sera placé avant le sien : son adresse n'est pas encore connue,
+    # on utilise donc un symbole comme en compilation séparée (voir nouvelle_fonction()).
+    if prefixe_symboles is None and not declare_des_fonctions(code):
+        fonctions[nom] = adresse_fonction_libre
+    else:
+        fonctions[nom] = nouveau_symbole(nom)
+    if englobante is None:
+        fonctions_englobantes.pop(nom, None)
+    else:
+        fonctions_englobantes[nom] = englobante
 
     corps = compile_ast(code)
+    restaure_fonctions(fonctions_masquees.pop())
 
-    # Lorsque quelqu'un devra exécuter la fonction, il devra allouer de l'espace sur sa pile pour les variables locales.
-    # Combien y en a-t-il ? Ce sont les variables qui n'étaient pas là avant de compiler le corps de la fonction !
-    alloue_locales = "rax <- const {}\n".format(len(variables) - num_variables) + "rsp <- add rax\n"
+    # Lorsque quelqu'un devra exécuter la fonction, il devra allouer de l'espace sur sa pile pour les variables
+    # locales : ce sont toutes les adresses locales utilisées pendant la compilation du corps.
+    alloue_locales = "rax <- const {}\n".format(adresse_locale_libre) + "rsp <- add rax\n"
 
     # On restaure l'environnement.
-    dans_une_fonction = False
-    variables = variables_copie
+    portees.pop()
+    adresse_locale_libre = adresse_locale_libre_copie
+    registres_sauves = registres_sauves_copie
 
-    code_final = empile_rbp + sauvegarde_rsp + alloue_locales + corps
+    code_final = empile_rbp + sauvegarde_rsp + alloue_locales + range_lien + range_args + corps
     # On ne rajoute rien après, on fait confiance à l'utilisateur pour avoir écrit un RENVOYER à la fin !
 
     nouvelle_fonction(nom, code_final)
 
+    # Si la fonction est pure (voir analyse.py), l'interpréteur pourra mettre ses résultats en cache.
+    # Il ne sait retrouver les arguments que sur la pile : rien à faire avec la convention par registres.
+    # Le lien statique fait partie des arguments : le cache ne mélange pas deux appels de f.
+    # Des variables visibles, l'analyse n'a besoin de connaître que celles que la fonction affecte.
+    affectees = set()
+    noms_affectes(code, affectees)
+    visibles = {v for v in affectees if cherche_variable(v) is not None}
+    if not convention_registres and analyse.est_pure(nom, args, code, visibles, noms_pures):
+        fonctions_pures[fonctions[nom]] = nb_args
+        noms_pures.add(nom)
+    else:
+        noms_pures.discard(nom) # Une fonction redéfinie n'est plus forcément pure
+
     # Pas de code à exécuter pour la déclaration ! Il sera rajouté en haut du code à la fin.
     return ""
 
+def restaure_fonctions(masquees):
+    """Remet les fonctions masquées par celles déclarées dans un corps de fonction qui vient d'être compilé."""
+    for nom, (adresse, englobante, pure) in masquees.items():
+        for table, valeur in ((fonctions, adresse), (fonctions_englobantes, englobante)):
+            if valeur is None:
+                table.pop(nom, None)
+            else:
+                table[nom] = valeur
+        if pure:
+            noms_pures.add(nom)
+        else:
+            noms_pures.discard(nom)
+
+def noms_affectes(ast, noms):
+    """Ajoute à noms les variables affectées dans le bloc (hors fonctions déclarées dedans)"""
+    if ast[0] == "AFFECTATION":
+        noms.add(ast[1])
+    elif ast[0] == "BLOC":
+        for a in ast[1]:
+            noms_affectes(a, noms)
+    elif ast[0] == "CONDITION":
+        noms_affectes(ast[2], noms)
+
+def note_registres_vivants(code, registres):
+    """
+    Pour chaque appel du corps d'une fonction, note dans registres_vivants ceux des registres de ses arguments
+    (registres["n"] contient celui de l'argument n) qui sont encore lus après l'appel : ce sont les seuls que
+    l'appelant doit sauvegarder (voir compile_appel_registres()).
+    On suit l'ordre dans lequel le code est compilé, en faisant comme si tout était exécuté (alors qu'un ALORS peut
+    être sauté, et qu'un RENVOYER arrête la fonction) : au pire, on sauvegarde un registre pour rien.
+    """
+    evenements = []
+    lectures_et_appels(code, evenements)
+    vivants = set()
+    for evenement, valeur in reversed(evenements):
+        if evenement == "appel":
+            registres_vivants[valeur] = set(vivants)
+        elif valeur in registres:
+            vivants.add(registres[valeur])
+
+def lectures_et_appels(ast, evenements):
+    """Ajoute à evenements les lectures de variables ("lit", nom) et les appels ("appel", id(args)), dans l'ordre."""
+    type = ast[0]
+    if type == "VARIABLE":
+        evenements.append(("lit", ast[1]))
+    elif type == "APPEL":
+        # Comme dans charge_registres(), les arguments simples peuvent être lus après les autres.
+        for arg in sorted(ast[2], key=argument_simple):
+            lectures_et_appels(arg, evenements)
+        evenements.append(("appel", id(ast[2])))
+    elif type == "BLOC":
+        for a in ast[1]:
+            lectures_et_appels(a, evenements)
+    elif type in ("AFFICHER", "RENVOYER"):
+        lectures_et_appels(ast[1], evenements)
+    elif type == "AFFECTATION":
+        lectures_et_appels(ast[2], evenements)
+    elif type in ("PLUS", "MOINS", "FOIS", "EGALE", "CONDITION"):
+        lectures_et_appels(ast[1], evenements)
+        lectures_et_appels(ast[2], evenements)
+
+def declare_des_fonctions(ast):
+    """Indique si le bloc contient la déclaration d'une fonction"""
+    if ast[0] == "FONCTION":
+        return True
+    elif ast[0] == "BLOC":
+        return any(declare_des_fonctions(a) for a in ast[1])
+    elif ast[0] == "CONDITION":
+        return declare_des_fonctions(ast[2])
+    return False
+
 def compile_renvoyer(ast):
     # On copie la valeur de retour dans rax
     retour_rax = compile_ast(ast) + depile("rax")
@@ -283,14 +512,19 @@ def compile_renvoyer(ast):
     restaure_rbp = depile("rbp")
 
     # Il ne reste plus qu'à depiler l'adresse de retour dans rip !
-    retour = depile("rip")
+    retour = "ret\n" if jeu_etendu else depile("rip")
 
     return retour_rax + restaure_pile + restaure_rbp + retour
 
 def compile_appel(nom, args):
+    if convention_registres:
+        return compile_appel_registres(nom, args)
+
     empile_args = ""
     for arg in args:
         empile_args += compile_ast(arg)
+    lien = compile_lien(nom)
+    empile_args += lien
 
     # Ici on fait un petit calcul avec rip pour connaître la bonne adresse de retour :
     # en effet, on sauvegarde rip avant de sauter dans la fonction, mais on quand on le
@@ -319,11 +553,15 @@ def compile_appel(nom, args):
       + empile("rax")       # 3 instructions
     )
 
-    adr = fonctions[nom]
-    appel = "rax <- const {}\n".format(adr - 1) + "rip <- copy rax\n"
+    appel = "rax <- const {}\n".format(adresse_fonction(nom, -1)) + "rip <- copy rax\n"
+
+    # Avec le jeu d'instructions étendu, call s'occupe de l'adresse de retour et du saut.
+    if jeu_etendu:
+        empile_adresse_de_retour = ""
+        appel = "call {}\n".format(adresse_fonction(nom))
 
     # On n'oublie pas de dépiler les arguments !
-    depile_args = "rbx <- const {}\n".format(len(args)) + "rsp <- sub rbx\n"
+    depile_args = "rbx <- const {}\n".format(len(args) + (lien != "")) + "rsp <- sub rbx\n"
 
     # Ni d'empiler la valeur de retour !
     empile_retour = empile("rax")
@@ -331,14 +569,210 @@ def compile_appel(nom, args):
     return empile_args + empile_adresse_de_retour + appel + depile_args + empile_retour
 
 
-def compile(ast):
+def compile_appel_registres(nom, args):
+    """
+    Convention d'appel par registres : les trois premiers arguments sont passés dans rsi, rdi et rdx,
+    les suivants sur la pile comme d'habitude.
+
+    Ces registres ne servent à rien d'autre, mais ils contiennent peut-être les arguments de la fonction en cours :
+    c'est donc à l'appelant de sauvegarder avant l'appel et de restaurer après ceux qu'il lit encore ensuite (voir
+    note_registres_vivants()). L'appelé, lui, ne s'engage qu'à restaurer rbp, comme avant.
+
+    S'il y a au plus trois arguments (lien statique compris), rien ne passe par la pile à part les arguments
+    compliqués, qui sont calculés comme d'habitude puis dépilés dans leur registre. Les arguments simples
+    (constantes et variables) vont directement dans leur registre, une fois tous les autres calculés (ces calculs
+    peuvent appeler des fonctions, qui changent les registres), sauf une variable en mémoire qu'un appel dans un
+    argument suivant pourrait modifier : elle est lue à son tour, comme un argument compliqué.
+    Sinon, état de la pile au moment du saut :
+
+    registres sauvegardés
+    argument 1  \
+    argument 2   | les trois premiers sont aussi chargés dans les registres, mais leur case reste là pour ne pas
+    .            | avoir à décaler les suivants
+    argument n  /
+    adresse de retour
+    """
+    vivants = registres_vivants.get(id(args), registres_sauves)
+    sauves = [reg for reg in registres_sauves if reg in vivants]
+    sauvegarde = "".join(empile(reg) for reg in sauves)
+    restauration = "".join(depile(reg) for reg in reversed(sauves))
+
+    # Le lien statique (voir compile_lien()) est un argument comme les autres, le dernier.
+    nb_args = len(args) + (nom in fonctions_englobantes)
+    if nb_args <= len(registres_arguments):
+        charge_args = charge_registres(nom, args)
+        args_sur_la_pile = 0
+    else:
+        # On calcule tous les arguments avant de toucher aux registres : ces calculs peuvent en avoir besoin !
+        charge_args = "".join(compile_ast(arg) for arg in args) + compile_lien(nom)
+        charge_args += "rbx <- copy rsp\n" + "rax <- const {}\n".format(nb_args) + "rbx <- sub rax\n"
+        charge_args += "rax <- const 1\n"
+        for i, reg in enumerate(registres_arguments):
+            if i > 0:
+                charge_args += "rbx <- add rax\n"
+            charge_args += "{} <- load (rbx)\n".format(reg)
+        args_sur_la_pile = nb_args
+
+    # L'adresse de retour est connue à la compilation : c'est celle du saut, 5 instructions plus loin
+    # (elle sera incrémentée au retour, voir compile_renvoyer()).
+    if jeu_etendu:
+        empile_adresse_de_retour = ""
+        appel = "call {}\n".format(adresse_fonction(nom))
+    else:
+        empile_adresse_de_retour = "rax <- const @+5\n" + empile("rax")
+        appel = "rax <- const {}\n".format(adresse_fonction(nom, -1)) + "rip <- copy rax\n"
+
+    depile_args = ""
+    if args_sur_la_pile > 0:
+        depile_args = "rbx <- const {}\n".format(args_sur_la_pile) + "rsp <- sub rbx\n"
+
+    return sauvegarde + charge_args + empile_adresse_de_retour + appel + depile_args \
+        + restauration + empile("rax")
+
+def argument_simple(ast):
+    return ast[0] in ("ENTIER", "VARIABLE")
+
+def contient_un_appel(ast):
+    if type(ast) == tuple:
+        return ast[0] == "APPEL" or any(contient_un_appel(a) for a in ast[1:])
+    if type(ast) == list:
+        return any(contient_un_appel(a) for a in ast)
+    return False
+
+def charge_registres(nom, args):
+    """Met les arguments (et le lien statique) dans leurs registres, quand il n'y en a pas plus que de registres."""
+    calcule = ""  # arguments compliqués, calculés sur la pile
+    depiles = []  # leurs registres
+    copies = []  # (registre, registre de la fonction en cours qui contient sa valeur)
+    charge = ""  # arguments simples qui ne sont pas dans un registre
+    for i, (arg, reg) in enumerate(zip(args, registres_arguments)):
+        # Une variable en mémoire est lue après les arguments suivants : ils ne doivent pas pouvoir la modifier
+        # (un appel peut changer une variable globale, comme x dans f(x, g())). Sinon, on la lit à son tour.
+        adresse = cherche_variable(arg[1]) if arg[0] == "VARIABLE" else None
+        en_memoire = adresse is not None and adresse[0] != "registre"
+        if not argument_simple(arg) or en_memoire and contient_un_appel(args[i + 1:]):
+            calcule += compile_ast(arg)
+            depiles.append(reg)
+        elif arg[0] == "ENTIER":
+            charge += "{} <- const {}\n".format(reg, arg[1])
+        else:
+            adresse = cherche_variable(arg[1])
+            if adresse is None:
+                raise RuntimeError("Variable inconnue : {}".format(arg[1]))
+            type, adr = adresse
+            if type == "registre":
+                copies.append((reg, adr))
+            else:
+                charge += adresse_dans_rbx(type, adr) + "{} <- load (rbx)\n".format(reg)
+    if nom in fonctions_englobantes:
+        charge += compile_lien(nom, registres_arguments[len(args)])
+
+    # Le dernier argument compliqué n'a pas besoin de passer par la pile : on le copie directement dans son
+    # registre, à moins qu'une copie ait encore besoin de l'ancienne valeur de celui-ci.
+    copie_directe = ""
+    if depiles and all(source != depiles[-1] for _, source in copies):
+        for reg in ("rax", "rbx"):
+            if calcule.endswith(empile(reg)):
+                calcule = calcule[:-len(empile(reg))]
+                copie_directe = "{} <- copy {}\n".format(depiles.pop(), reg)
+                break
+
+    # Les copies lisent les registres de la fonction en cours : elles passent avant tout ce qui les écrase.
+    # Le reste n'utilise que rbx et rcx.
+    depile_args = "".join(depile(reg) for reg in reversed(depiles))
+    return calcule + copie_directe + copie_registres(copies) + charge + depile_args
+
+def copie_registres(copies):
+    """
+    Fait les copies (destination, source) entre registres comme si elles avaient lieu en même temps : une source
+    n'est écrasée qu'une fois lue (pour g(b, a) appelé dans f(a, b), rsi et rdi sont échangés).
+    """
+    copies = [(dest, source) for dest, source in copies if dest != source]
+    code = ""
+    while copies:
+        for i, (dest, source) in enumerate(copies):
+            if all(s != dest for _, s in copies):
+                code += "{} <- copy {}\n".format(dest, source)
+                del copies[i]
+                break
+        else:
+            # Toutes les destinations sont encore à lire (un cycle) : on met une source de côté dans rax.
+            source = copies[0][1]
+            code += "rax <- copy {}\n".format(source)
+            copies = [(d, "rax" if s == source else s) for d, s in copies]
+    return code
+
+def compile_lien(nom, reg=None):
+    """
+    Empile le lien statique à passer à la fonction nom si elle est déclarée dans une autre fonction (voir
+    compile_fonction()) : le rbp de cette fonction englobante. Rien sinon.
+    Avec reg, le lien est mis directement dans ce registre au lieu d'être empilé.
+    L'appel est forcément compilé dans la fonction englobante (le lien est alors rbp), ou dans une fonction déclarée
+    à l'intérieur : il faut suivre les liens statiques jusqu'à elle.
+    """
+    if nom not in fonctions_englobantes:
+        return ""
+    for i in range(len(portees) - 1, 0, -1):
+        if portees[i] is fonctions_englobantes[nom]:
+            sauts = len(portees) - 1 - i
+            if reg is not None:
+                return "{} <- copy rbp\n".format(reg) + "{0} <- load ({0})\n".format(reg) * sauts
+            return "rbx <- copy rbp\n" + "rbx <- load (rbx)\n" * sauts + empile("rbx")
+    raise RuntimeError("La fonction {} ne peut être appelée que dans la fonction où elle est déclarée".format(nom))
+
+
+def resout_adresses(code):
+    """Remplace les adresses relatives '@+k' par l'adresse de l'instruction k lignes plus loin."""
+    lignes = code.split('\n')
+    for i, ligne in enumerate(lignes):
+        if '@+' in ligne:
+            debut, k = ligne.split('@+')
+            lignes[i] = debut + str(i + int(k))
+    return '\n'.join(lignes)
+
+
+def reinitialise():
+    """Remet à zéro l'état du compilateur, pour pouvoir compiler un nouveau programme."""
+    global variables, portees, adresse_globale_libre, adresse_locale_libre
+    global fonctions, entrees, fonctions_englobantes, fonctions_masquees, fonctions_pures, noms_pures
+    global code_fonctions, adresse_fonction_libre, registres_sauves, registres_vivants, prefixe_symboles, symboles
+    variables = {}
+    portees = [variables]
+    adresse_globale_libre = 0
+    adresse_locale_libre = 0
+    fonctions = {}
+    entrees = {}
+    fonctions_englobantes = {}
+    fonctions_masquees = []
+    fonctions_pures = {}
+    noms_pures = set()
+    code_fonctions = ""
+    adresse_fonction_libre = 3
+    registres_sauves = []
+    registres_vivants = {}
+    prefixe_symboles = None
+    symboles = {}
+
+
+def compile(ast, optimise=False, registres=False, etendu=False):
     """
     Cette fonction se charge de compiler le programme entier : c'est-à-dire, elle rajoute le code
     qui alloue la place pour les variables, ainsi que le code de déclaration des fonctions.
+    Avec optimise=True, on optimise d'abord l'AST (voir optimisations.py).
+    Avec registres=True, on utilise la convention d'appel par registres (voir compile_appel_registres()).
+    Avec etendu=True, on utilise les instructions push, pop, call et ret (voir interprete_asm.py).
     """
+    global convention_registres, jeu_etendu
+    reinitialise()
+    convention_registres = registres
+    jeu_etendu = etendu
+
+    if optimise:
+        ast = optimisations.optimise(ast)
+
     code = compile_ast(ast)
 
     alloue_variables = "rax <- const {}\n".format(len(variables)) + "rsp <- add rax\n"
     saut = "rip <- const {}\n".format(adresse_fonction_libre - 1) # - 1 car rip est incrémenté à la fin du 'const' !
 
-    return alloue_variables + saut + code_fonctions + code
+    return resout_adresses(alloue_variables + saut + code_fonctions + code)
@@ -0,0 +1,202 @@
+"""
+Compilation séparée et édition de liens.
+
+Utilisation :
+>>> import parser, edition
+>>> cache = {}
+>>> asm = edition.compile_separement(parser.parse(code), cache)          # compile tout
+>>> asm = edition.compile_separement(parser.parse(code_modifie), cache)  # ne recompile que les fonctions modifiées
+>>> edition.recompilees                                                   # noms des fonctions recompilées
+
+compile.compile() recompile tout le programme à chaque fois, et la place des fonctions dépend de toutes celles
+déclarées avant : changer une fonction oblige à tout recompiler.
+Ici, chaque FONCTION du programme principal est compilée à part, en un objet relogeable : son code ne contient pas
+les adresses des fonctions appelées, mais des symboles (voir compile.adresse_fonction()), et il ne dépend pas de
+l'endroit où il sera placé. L'éditeur de liens (lie()) place ensuite les objets les uns après les autres, comme le
+fait compile.compile() avec code_fonctions, et remplace les symboles par les vraies adresses.
+
+Un objet est un dictionnaire qui contient :
+- "lignes" : le code de la fonction (et des fonctions déclarées à l'intérieur), une instruction par élément,
+- "relocations" : les lignes qui contiennent une adresse à calculer à l'édition de liens (voir reloge()),
+- "symboles" : la position de chaque fonction de l'objet dans son code,
+- "fonctions", "entrees", "englobantes", "pures", "globales" : ce que la compilation a changé dans l'état du
+  compilateur (nouvelles fonctions, nom de chaque symbole de fonction, fonctions déclarées dans une autre, fonctions
+  pures, et nombre de variables globales créées),
+  pour pouvoir le refaire sans recompiler,
+- "adresse_globale" : la première adresse libre pour une variable globale au moment de la compilation (si la
+  fonction a créé des variables globales, leur adresse en dépend).
+
+Le cache associe un objet à tout ce dont dépend sa compilation : le code de la fonction, mais aussi les variables
+et les fonctions visibles au moment de la déclaration. Si rien de cela n'a changé, l'objet est réutilisé tel quel.
+Le code du programme principal, lui, est toujours recompilé.
+"""
+
+import re
+
+import compile
+
+
+recompilees = []  # noms des fonctions recompilées lors du dernier appel à compile_separement()
+noms_des_declarations = {}  # noms utilisés par chaque déclaration déjà vue (voir cle_objet())
+
+
+def compile_objet(declaration, prefixe):
+    """Compile une déclaration de fonction en un objet, dont les symboles commencent par prefixe."""
+    sauvegarde = compile.code_fonctions, compile.adresse_fonction_libre, compile.symboles, compile.prefixe_symboles
+    compile.code_fonctions, compile.adresse_fonction_libre, compile.symboles = "", 0, {}
+    compile.prefixe_symboles = prefixe
+    fonctions = dict(compile.fonctions)
+    englobantes = dict(compile.fonctions_englobantes)
+    globales = compile.adresse_globale_libre
+
+    compile.compile_ast(declaration)
+
+    objet = reloge(compile.code_fonctions)
+    objet.update({
+        "adresse_globale": globales,
+        "symboles": compile.symboles,
+        "fonctions": {nom: s for nom, s in compile.fonctions.items() if fonctions.get(nom) != s},
+        "entrees": {s: nom for s, nom in compile.entrees.items() if s in compile.symboles},
+        "englobantes": {nom: p for nom, p in compile.fonctions_englobantes.items() if englobantes.get(nom) is not p},
+        "pures": {s: n for s, n in compile.fonctions_pures.items() if s in compile.symboles},
+        "globales": compile.adresse_globale_libre - globales,
+    })
+    compile.code_fonctions, compile.adresse_fonction_libre, compile.symboles, compile.prefixe_symboles = sauvegarde
+    return objet
+
+def cle_objet(declaration, prefixe):
+    """
+    Tout ce dont dépend la compilation d'une déclaration : son code, et l'adresse (ou le symbole) de chaque variable
+    et fonction dont elle utilise le nom. On ne regarde que ces noms-là, pour que la clé reste petite même quand le
+    programme contient beaucoup de fonctions.
+    """
+    texte = repr(declaration)
+    if texte not in noms_des_declarations:
+        noms = set()
+        noms_utilises(declaration, noms)
+        noms_des_declarations[texte] = sorted(noms)
+    noms = noms_des_declarations[texte]
+    variables = tuple((nom, compile.variables.get(nom)) for nom in noms)
+    fonctions = tuple((nom, compile.fonctions.get(nom), compile.fonctions.get(nom) in compile.fonctions_pures)
+                      for nom in noms)
+    return texte, prefixe, variables, fonctions, compile.convention_registres, compile.jeu_etendu
+
+def noms_utilises(ast, noms):
+    if type(ast) == tuple:
+        if ast[0] in ("VARIABLE", "AFFECTATION", "APPEL"):
+            noms.add(ast[1])
+        for a in ast[1:]:
+            noms_utilises(a, noms)
+    elif type(ast) == list:
+        for a in ast:
+            noms_utilises(a, noms)
+
+def charge_objet(objet):
+    """Refait dans l'état du compilateur ce qu'a fait la compilation de l'objet."""
+    compile.fonctions.update(objet["fonctions"])
+    compile.entrees.update(objet["entrees"])
+    for nom in objet["fonctions"]:
+        compile.fonctions_englobantes.pop(nom, None)
+    compile.fonctions_englobantes.update(objet["englobantes"])
+    compile.fonctions_pures.update(objet["pures"])
+    for nom, symbole in objet["fonctions"].items():
+        if symbole in objet["pures"]:
+            compile.noms_pures.add(nom)
+        else:
+            compile.noms_pures.discard(nom)
+    compile.adresse_globale_libre += objet["globales"]
+
+
+def reloge(code):
+    """
+    Découpe du code en lignes, et note celles qui contiennent une adresse (toujours à la fin de la ligne) :
+    - '@f.1/f-1' : l'adresse de la fonction de symbole f.1/f, moins 1 ;
+    - '@+5' : l'adresse de l'instruction 5 lignes plus loin (voir compile.resout_adresses()), qui dépend de la
+      place où le code sera mis.
+    Chaque relocation est de la forme (numéro de la ligne, début de la ligne, symbole, décalage), où le symbole est
+    None pour une adresse dans le code lui-même.
+    """
+    lignes = code.split('\n')[:-1]
+    relocations = []
+    for i, ligne in enumerate(lignes):
+        if '@' in ligne:
+            debut, adresse = ligne.split('@')
+            m = re.fullmatch(r"([^+-]*)([+-]\d+)?", adresse)
+            if m.group(1):
+                relocations.append((i, debut, m.group(1), int(m.group(2) or 0)))
+            else:
+                relocations.append((i, debut, None, i + int(m.group(2))))
+    return {"lignes": lignes, "relocations": relocations}
+
+def lie(objets, nb_variables):
+    """
+    Place les objets les uns après les autres (le dernier est le programme principal, qui commence à la ligne
+    "entree" de son code), et calcule les adresses
+    laissées en attente. Comme après compile.compile(), compile.fonctions, compile.entrees et compile.fonctions_pures
+    contiennent ensuite les vraies adresses des fonctions.
+    """
+    adresses = {}
+    debuts = []
+    adresse = 3 # instructions 0 et 1 pour allouer les variables, 2 pour sauter au point d'entrée
+    for objet in objets:
+        debuts.append(adresse)
+        for symbole, position in objet["symboles"].items():
+            adresses[symbole] = adresse + position
+        adresse += len(objet["lignes"])
+
+    entree = debuts[-1] + objets[-1]["entree"]
+    prog = ["rax <- const {}".format(nb_variables), "rsp <- add rax", "rip <- const {}".format(entree - 1)]
+    for objet, debut in zip(objets, debuts):
+        lignes = list(objet["lignes"])
+        for i, texte, symbole, decalage in objet["relocations"]:
+            lignes[i] = texte + str((debut if symbole is None else adresses[symbole]) + decalage)
+        prog += lignes
+
+    compile.fonctions = {nom: adresses[s] for nom, s in compile.fonctions.items()}
+    compile.entrees = {adresses[s]: nom for s, nom in compile.entrees.items()}
+    compile.fonctions_pures = {adresses[s]: n for s, n in compile.fonctions_pures.items()}
+    return "\n".join(prog) + "\n"
+
+
+def compile_separement(ast, cache=None, registres=False, etendu=False):
+    """
+    Compile le programme en réutilisant les objets du cache quand c'est possible (et y ajoute les nouveaux).
+    registres et etendu ont le même sens que pour compile.compile().
+    """
+    global recompilees
+    if cache is None:
+        cache = {}
+    compile.reinitialise()
+    compile.convention_registres = registres
+    compile.jeu_etendu = etendu
+    # Les fonctions déclarées ailleurs qu'au premier niveau (dans un SI par exemple) restent dans code_fonctions,
+    # avec des symboles sans préfixe.
+    compile.prefixe_symboles = ""
+    compile.adresse_fonction_libre = 0
+
+    recompilees = []
+    objets = []
+    occurrences = {}  # nombre de déclarations de chaque nom, pour distinguer les redéfinitions
+    code = ""
+    for instr in ast[1]:
+        if instr[0] != "FONCTION":
+            code += compile.compile_ast(instr)
+            continue
+
+        nom = instr[1]
+        occurrences[nom] = occurrences.get(nom, 0) + 1
+        prefixe = "{}.{}/".format(nom, occurrences[nom])
+        cle = cle_objet(instr, prefixe)
+        objet = cache.get(cle)
+        if objet is None or objet["globales"] and objet["adresse_globale"] != compile.adresse_globale_libre:
+            cache[cle] = compile_objet(instr, prefixe)
+            recompilees.append(nom)
+        charge_objet(cache[cle])
+        objets.append(cache[cle])
+
+    # Le programme principal, avec les fonctions qui n'ont pas été compilées à part
+    principal = reloge(compile.code_fonctions + code)
+    principal["symboles"] = compile.symboles
+    principal["entree"] = compile.adresse_fonction_libre
+    objets.append(principal)
+    return lie(objets, len(compile.variables))
@@ -0,0 +1,200 @@
+"""
+Evalue directement un AST, sans le compiler.
+
+Utilisation :
+>>> import parser, evalue
+>>> evalue.evalue(parser.parse('AFFICHER((3 + 2) * 6 + 12)'))
+>>> evalue.compare(code)       # même programme évalué directement, et compilé puis interprété de plusieurs façons
+>>> evalue.differences(code)   # les compilateurs qui n'affichent pas la même chose que l'évaluation directe
+
+Pour un petit programme, compiler puis interpréter des centaines d'instructions assembleur prend bien plus de
+temps que de suivre l'arbre. Surtout, l'évaluation directe est simple : c'est une référence pour vérifier que les
+compilateurs (et leurs optimisations) ne changent pas ce qu'affiche un programme.
+
+Le sens du langage est celui de compile.py :
+- a = b vaut a - b, et le ALORS d'un SI n'est exécuté que si la condition vaut 0 ;
+- une variable affectée dans le programme principal est globale ;
+- une variable affectée dans une fonction est locale, sauf si elle était déjà visible au moment de la déclaration
+  (variable globale, ou variable de la fonction englobante) : on modifie alors la variable extérieure ;
+- une fonction déclarée dans une autre voit les variables de celle-ci (comme x dans p7.code) ;
+- comme pour les variables, une fonction n'appelle que les fonctions visibles au moment de sa déclaration (et
+  elle-même) : une fonction déclarée après elle n'existe pas encore, et redéfinir g ensuite ne change pas les
+  appels de f à g.
+Une variable affectée dans un ALORS qui n'est pas exécuté existe quand même, et vaut 0 (comme une case mémoire jamais
+écrite), puisque compile.py lui réserve une place dans tous les cas. De même, une fonction déclarée dans un tel ALORS
+peut être appelée.
+Lire une variable locale qui n'a pas encore été affectée donne donc 0 (comme dans ssa.py), alors qu'avec compile.py
+on lit ce qui se trouvait sur la pile : differences() signale ces programmes-là, qui dépendent de ce hasard.
+
+Une portée est un dictionnaire :
+- "variables" : la valeur de chaque variable de la portée,
+- "fonctions" : les fonctions déclarées dans la portée,
+- "parent" : la portée où la fonction a été déclarée (None pour le programme principal),
+- "visibles" : les noms des variables visibles depuis le parent au moment de la déclaration,
+- "fonctions_visibles" : les fonctions visibles au moment de la déclaration (y compris la fonction elle-même).
+"""
+
+import contextlib
+import io
+import time
+
+import parser, compile, interprete_asm, ssa
+
+
+def evalue(ast):
+    """Exécute un programme (un AST renvoyé par parser.parse())."""
+    portee = nouvelle_portee(None, set(), {})
+    if instruction(ast, portee) is not None:
+        raise RuntimeError("RENVOYER en dehors d'une fonction")
+
+def nouvelle_portee(parent, visibles, fonctions_visibles):
+    return {"variables": {}, "fonctions": {}, "parent": parent, "visibles": visibles,
+            "fonctions_visibles": fonctions_visibles}
+
+
+# Variables
+
+def portee_de(nom, portee):
+    """Portée qui contient la variable nom, ou None si elle n'est pas visible."""
+    while portee is not None:
+        if nom in portee["variables"]:
+            return portee
+        if nom not in portee["visibles"]:
+            return None
+        portee = portee["parent"]
+    return None
+
+def noms_visibles(portee):
+    return set(portee["variables"]) | portee["visibles"]
+
+def lit(nom, portee):
+    p = portee_de(nom, portee)
+    if p is None:
+        raise RuntimeError("Variable inconnue : {}".format(nom))
+    return p["variables"][nom]
+
+def affecte(nom, valeur, portee):
+    p = portee_de(nom, portee)
+    (portee if p is None else p)["variables"][nom] = valeur
+
+def declare_affectations(ast, portee):
+    """Crée (à 0) les variables affectées dans un ALORS qui n'est pas exécuté, et déclare ses fonctions."""
+    type = ast[0]
+    if type == "AFFECTATION" and portee_de(ast[1], portee) is None:
+        portee["variables"][ast[1]] = 0
+    elif type == "BLOC":
+        for a in ast[1]:
+            declare_affectations(a, portee)
+    elif type == "CONDITION":
+        declare_affectations(ast[2], portee)
+    elif type == "FONCTION":
+        instruction(ast, portee)
+
+
+# Fonctions
+
+def fonction(nom, portee):
+    if nom in portee["fonctions"]:
+        return portee["fonctions"][nom]
+    if nom in portee["fonctions_visibles"]:
+        return portee["fonctions_visibles"][nom]
+    raise RuntimeError("Fonction inconnue : {}".format(nom))
+
+def appel(nom, args, portee):
+    parametres, corps, declaration = fonction(nom, portee)
+    if len(args) != len(parametres):
+        raise RuntimeError("La fonction {} attend {} arguments, pas {}".format(nom, len(parametres), len(args)))
+    valeurs = [expression(a, portee) for a in args]
+
+    interieur = nouvelle_portee(declaration["portee"], declaration["visibles"], declaration["fonctions"])
+    interieur["variables"].update(zip(parametres, valeurs))
+    resultat = instruction(corps, interieur)
+    if resultat is None:
+        raise RuntimeError("La fonction {} s'est terminée sans RENVOYER".format(nom))
+    return resultat
+
+
+# Evaluation
+
+def instruction(ast, portee):
+    """Exécute une instruction. Renvoie la valeur renvoyée si un RENVOYER a été exécuté, None sinon."""
+    type = ast[0]
+    if type == "AFFICHER":
+        print(expression(ast[1], portee))
+    elif type == "AFFECTATION":
+        affecte(ast[1], expression(ast[2], portee), portee)
+    elif type == "BLOC":
+        for a in ast[1]:
+            resultat = instruction(a, portee)
+            if resultat is not None:
+                return resultat
+    elif type == "CONDITION":
+        if expression(ast[1], portee) == 0:
+            return instruction(ast[2], portee)
+        declare_affectations(ast[2], portee)
+    elif type == "FONCTION":
+        # Les variables et les fonctions visibles sont celles qui existent maintenant, pas au moment de l'appel.
+        fonctions = dict(portee["fonctions_visibles"])
+        fonctions.update(portee["fonctions"])
+        declaration = {"portee": portee, "visibles": noms_visibles(portee), "fonctions": fonctions}
+        portee["fonctions"][ast[1]] = fonctions[ast[1]] = ast[2], ast[3], declaration
+    elif type == "RENVOYER":
+        return expression(ast[1], portee)
+    else:
+        expression(ast, portee)
+    return None
+
+def expression(ast, portee):
+    type = ast[0]
+    if type == "ENTIER":
+        return int(ast[1])
+    elif type == "PLUS":
+        return expression(ast[1], portee) + expression(ast[2], portee)
+    elif type in ("MOINS", "EGALE"):
+        return expression(ast[1], portee) - expression(ast[2], portee)
+    elif type == "FOIS":
+        return expression(ast[1], portee) * expression(ast[2], portee)
+    elif type == "VARIABLE":
+        return lit(ast[1], portee)
+    elif type == "APPEL":
+        return appel(ast[1], ast[2], portee)
+    raise RuntimeError("Expression inconnue : {}".format(type))
+
+
+# Comparaison avec les compilateurs
+
+compilateurs = {
+    "compile": compile.compile,
+    "optimise": lambda ast: compile.compile(ast, optimise=True),
+    "registres": lambda ast: compile.compile(ast, registres=True),
+    "etendu": lambda ast: compile.compile(ast, etendu=True),
+    "ssa": ssa.compile,
+}
+
+def execute(fonction, *args):
+    """Appelle fonction en récupérant ce qu'elle affiche (et l'erreur éventuelle), et le temps qu'elle prend."""
+    sortie = io.StringIO()
+    debut = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(sortie):
+            fonction(*args)
+    except Exception as e:
+        sortie.write("{} : {}\n".format(type(e).__name__, e))
+    return {"sortie": sortie.getvalue(), "temps": time.perf_counter() - debut}
+
+def compare(prog, compilateurs=compilateurs):
+    """
+    Evalue prog directement, puis le compile et l'interprète avec chacun des compilateurs.
+    Renvoie pour chacun ("direct" pour l'évaluation directe) ce qui a été affiché et le temps pris (en secondes,
+    compilation comprise, mais pas le parsing qui est le même pour tous).
+    """
+    ast = parser.parse(prog)
+    resultats = {"direct": execute(evalue, ast)}
+    for nom, cpl in compilateurs.items():
+        resultats[nom] = execute(lambda: interprete_asm.interprete(cpl(ast)))
+    return resultats
+
+def differences(prog, compilateurs=compilateurs):
+    """Noms des compilateurs qui n'affichent pas la même chose que l'évaluation directe."""
+    resultats = compare(prog, compilateurs)
+    return [nom for nom in compilateurs if resultats[nom]["sortie"] != resultats["direct"]["sortie"]]
@@ -14,6 +14,12 @@ Opérations autorisées :
 (reg1) <- store  reg2    # le contenu de reg2 est stocké en mémoire à l'adresse reg1
  reg1  <- addinz reg2    # si reg1 est différent de 0, ajoute reg2 à rip, sinon, ne fait rien
 
+Jeu d'instructions étendu (utilisé seulement par compile(ast, etendu=True), qui s'en passe par défaut) :
+          push   reg1    # empile le contenu de reg1 : (rsp) <- store reg1, puis rsp augmente de 1
+          pop    reg1    # dépile dans reg1 : rsp diminue de 1, puis reg1 <- load (rsp)
+          call    n      # empile rip, puis saute à l'instruction n
+          ret            # dépile rip : on revient juste après le call
+
 En théorie, on n'utilise que des entiers non signés (positifs) entre 0 et 255 (8 bits = 1 octet).
 Cependant, je ne fais aucun tests et ne gère pas les débordements : vous êtes libre de modifier le code si vous en avez besoin !
 Essayez cependant de n'ajouter des opération que si vous êtes VRAIMENT sûr que c'est impossible sans : cela fait partie de l'exercice !
@@ -30,10 +36,71 @@ rcx
 rdx
 
 La mémoire est de taille 256 : si votre pile déborde, c'est probablement que vous gérez mal une récursion quelque part ;)
+(l'analyse de analyse.profondeur_pile() permet de connaître la taille nécessaire sans exécuter le programme ;
+execute() s'en sert si on lui donne l'adresse de toutes les fonctions)
 """
 
-def interprete(instructions):
-    lignes = list(filter(None, instructions.split('\n')))
+import sys
+from collections import OrderedDict, deque
+
+import analyse
+
+# Opérations et registres connus, dans l'ordre de leur numéro dans le format binaire (voir objet.py).
+operations = ["const", "copy", "add", "sub", "mul", "print", "load", "store", "addinz", "push", "pop", "call", "ret"]
+noms_registres = ["rip", "rsp", "rbp", "rsi", "rdi", "rax", "rbx", "rcx", "rdx"]
+
+
+def decode(instructions):
+    """
+    Transforme le texte assembleur en une liste de triplets (dest, op, source).
+    Le texte n'est ainsi découpé qu'une seule fois, et non à chaque exécution d'une instruction.
+    """
+    return [decode_instr(ligne) for ligne in filter(None, instructions.split('\n'))]
+
+def decode_instr(ligne):
+    operandes = ligne.split()
+
+    if len(operandes) == 1: # ret n'a pas d'opérande
+        operandes = ['', ''] + operandes + ['']
+    if len(operandes) == 2: # print (et push, pop, call) est un cas à part
+        operandes = ['', ''] + operandes
+
+    # dest <- op source
+    # On enlève aussi les parenthèses et le % qui ne sont pas nécessaires
+    dest = operandes[0].lstrip('(%').rstrip(')')
+    op = operandes[2]
+    source = operandes[3].lstrip('(%').rstrip(')')
+    if op == "const" or op == "call":
+        source = int(source)
+
+    return dest, op, source
+
+
+def interprete(instructions, pures=None, taille_cache=256, entrees=None, ecouteurs=None):
+    execute(decode(instructions), pures, taille_cache, entrees, ecouteurs)
+
+def execute(programme, pures=None, taille_cache=256, entrees=None, ecouteurs=None):
+    """
+    Exécute une liste d'instructions déjà décodées (voir decode()).
+
+    Si pures est donné (par exemple compile.fonctions_pures), il associe à l'adresse de chaque fonction pure
+    son nombre d'arguments : le résultat des appels à ces fonctions est alors gardé dans un cache, et un appel
+    avec les mêmes arguments n'exécute plus la fonction. Le cache garde au plus taille_cache résultats,
+    en oubliant d'abord ceux qui n'ont pas servi depuis le plus longtemps.
+
+    Si entrees est donné (le nom de la fonction à chaque adresse, pour toutes les fonctions, comme compile.entrees),
+    on cherche d'abord la taille de mémoire dont le programme a besoin (voir taille_prouvee()). Si elle est connue,
+    la mémoire a exactement cette taille, et la boucle ci-dessous n'a rien à vérifier. Sinon (fonction récursive, ou
+    entrees pas donné), la mémoire a 256 cases, et execute_verifie() vérifie à chaque accès que l'on ne déborde pas.
+
+    Si ecouteurs est donné, ce sont des fonctions appelées à chaque événement de l'exécution (voir
+    execute_instrumente()). Sans écouteurs, c'est la boucle ci-dessous, qui ne perd pas de temps à les chercher.
+    """
+    taille = taille_prouvee(programme, entrees)
+    if ecouteurs:
+        return execute_instrumente(programme, pures, taille_cache, taille, ecouteurs)
+    if taille is None:
+        return execute_verifie(programme, pures, taille_cache)
 
     # Registres :
     registres = {
@@ -49,35 +116,33 @@ def interprete(instructions):
     }
 
     # Mémoire :
-    memoire = [0] * 256
-
-    # Boucle principale (on s'arrête si on sort du programme)
-    while registres["rip"] < len(lignes):
-        ligne = lignes[registres["rip"]]
-        operandes = ligne.split()
+    memoire = [0] * taille
 
-        if len(operandes) == 2: # print est un cas à part
-            operandes = ['', ''] + operandes
+    # Cache des appels de fonctions pures : (adresse, arguments) -> résultat
+    cache = OrderedDict()
+    # Appels de fonctions pures en cours : (adresse, arguments), position de l'adresse de retour sur la pile
+    en_cours = []
 
-        # dest <- op source
-        # On enlève aussi les parenthèses et le % qui ne sont pas nécessaires
-        dest = operandes[0].lstrip('(%').rstrip(')')
-        op = operandes[2]
-        source = operandes[3].lstrip('(%').rstrip(')')
+    # Boucle principale (on s'arrête si on sort du programme)
+    while registres["rip"] < len(programme):
+        dest, op, source = programme[registres["rip"]]
 
         # Décommentez ces lignes si vous voulez débugger votre programme :
         # elles sont très utiles !
         # Croyez-moi, ce n'est pas aussi simple avec du vrai assembleur qui
         # s'exécute directement sur le processeur ;)
-        # print("rip", registres["rip"], "sur", operandes)
+        # print("rip", registres["rip"], "sur", dest, op, source)
         # print(registres)
         # print(memoire)
+        # (sur un vrai programme, c'est beaucoup trop : voyez plutôt traceur() plus bas)
 
         # Exécution de l'instruction courante
         if op == "const":
-            registres[dest] = int(source)
+            registres[dest] = source
         elif op == "copy":
             registres[dest] = registres[source]
+            if dest == "rip" and pures is not None:
+                appel_pur(registres, memoire, pures, cache, en_cours)
         elif op == "add":
             registres[dest] += registres[source]
         elif op == "sub":
@@ -88,25 +153,335 @@ def interprete(instructions):
             print(registres[source])
         elif op == "load":
             registres[dest] =  memoire[registres[source]]
+            if dest == "rip" and en_cours and en_cours[-1][1] == registres["rsp"]:
+                cache[en_cours.pop()[0]] = registres["rax"]
+                if len(cache) > taille_cache:
+                    cache.popitem(last=False)
         elif op == "store":
             memoire[registres[dest]] =  registres[source]
         elif op == "addinz":
             if registres[dest] != 0:
                 registres["rip"] += registres[source]
+        elif op == "push":
+            memoire[registres["rsp"]] = registres[source]
+            registres["rsp"] += 1
+        elif op == "pop":
+            registres["rsp"] -= 1
+            registres[source] = memoire[registres["rsp"]]
+        elif op == "call":
+            memoire[registres["rsp"]] = registres["rip"]
+            registres["rsp"] += 1
+            registres["rip"] = source - 1
+            if pures is not None:
+                appel_pur(registres, memoire, pures, cache, en_cours)
+        elif op == "ret":
+            registres["rsp"] -= 1
+            registres["rip"] = memoire[registres["rsp"]]
+            if en_cours and en_cours[-1][1] == registres["rsp"]:
+                cache[en_cours.pop()[0]] = registres["rax"]
+                if len(cache) > taille_cache:
+                    cache.popitem(last=False)
 
         registres["rip"] += 1
 
+def taille_prouvee(programme, entrees):
+    """
+    Taille de mémoire dont le programme a besoin d'après analyse.taille_memoire(), ou None si on ne la connaît pas.
+    L'analyse a besoin de l'adresse des fonctions pour reconnaître les appels : sans elles, on ne prouve rien.
+    """
+    if entrees is None:
+        return None
+    return analyse.taille_memoire(programme, entrees)
+
+def execute_verifie(programme, pures, taille_cache):
+    """
+    Même chose que la boucle de execute(), pour un programme dont on ne connaît pas la taille de mémoire : elle a
+    256 cases, et on vérifie à chaque accès que l'on ne déborde pas.
+    """
+    registres = {reg: 0 for reg in noms_registres}
+    memoire = [0] * 256
+    taille = len(memoire)
+    cache = OrderedDict()
+    en_cours = []
+
+    while registres["rip"] < len(programme):
+        dest, op, source = programme[registres["rip"]]
+
+        if op == "const":
+            registres[dest] = source
+        elif op == "copy":
+            registres[dest] = registres[source]
+            if dest == "rip" and pures is not None:
+                appel_pur(registres, memoire, pures, cache, en_cours)
+        elif op == "add":
+            registres[dest] += registres[source]
+        elif op == "sub":
+            registres[dest] -= registres[source]
+        elif op == "mul":
+            registres[dest] *= registres[source]
+        elif op == "print":
+            print(registres[source])
+        elif op == "load":
+            adresse = registres[source]
+            if not 0 <= adresse < taille:
+                verifie_adresse(adresse, memoire, registres)
+            registres[dest] = memoire[adresse]
+            if dest == "rip" and en_cours and en_cours[-1][1] == registres["rsp"]:
+                cache[en_cours.pop()[0]] = registres["rax"]
+                if len(cache) > taille_cache:
+                    cache.popitem(last=False)
+        elif op == "store":
+            adresse = registres[dest]
+            if not 0 <= adresse < taille:
+                verifie_adresse(adresse, memoire, registres)
+            memoire[adresse] = registres[source]
+        elif op == "addinz":
+            if registres[dest] != 0:
+                registres["rip"] += registres[source]
+        elif op == "push":
+            adresse = registres["rsp"]
+            if not 0 <= adresse < taille:
+                verifie_adresse(adresse, memoire, registres)
+            memoire[adresse] = registres[source]
+            registres["rsp"] = adresse + 1
+        elif op == "pop":
+            adresse = registres["rsp"] - 1
+            if not 0 <= adresse < taille:
+                verifie_adresse(adresse, memoire, registres)
+            registres["rsp"] = adresse
+            registres[source] = memoire[adresse]
+        elif op == "call":
+            adresse = registres["rsp"]
+            if not 0 <= adresse < taille:
+                verifie_adresse(adresse, memoire, registres)
+            memoire[adresse] = registres["rip"]
+            registres["rsp"] = adresse + 1
+            registres["rip"] = source - 1
+            if pures is not None:
+                appel_pur(registres, memoire, pures, cache, en_cours)
+        elif op == "ret":
+            adresse = registres["rsp"] - 1
+            if not 0 <= adresse < taille:
+                verifie_adresse(adresse, memoire, registres)
+            registres["rsp"] = adresse
+            registres["rip"] = memoire[adresse]
+            if en_cours and en_cours[-1][1] == adresse:
+                cache[en_cours.pop()[0]] = registres["rax"]
+                if len(cache) > taille_cache:
+                    cache.popitem(last=False)
+
+        registres["rip"] += 1
+
+
+# Ecouteurs : on peut suivre l'exécution en donnant à execute() un dictionnaire de fonctions, appelées à chaque
+# événement (celles qui manquent sont ignorées) :
+# - "instruction" (rip, instr, registres) : avant chaque instruction, instr est décodée (voir decode())
+# - "ecriture" (adresse, valeur)          : après chaque écriture en mémoire (store, push, call)
+# - "appel" (adresse, rsp)                : après un saut vers une fonction, à l'adresse donnée
+# - "retour" (adresse, rax)               : après un retour de fonction, qui reprend juste après adresse
+# - "affichage" (valeur)                  : à chaque print
+# - "erreur" (erreur, registres, memoire) : si l'exécution plante (l'erreur est ensuite relancée)
+# Comme pour le cache des fonctions pures, un saut par 'rip <- copy' ou call est un appel, et un saut par
+# 'rip <- load', pop rip ou ret est un retour (voir compile_appel() et compile_renvoyer()).
+
+evenements_possibles = ["instruction", "ecriture", "appel", "retour", "affichage", "erreur"]
+
+def execute_instrumente(programme, pures, taille_cache, taille, ecouteurs):
+    """Même chose que la boucle de execute(), en prévenant les écouteurs (taille : voir taille_prouvee())."""
+    for nom in ecouteurs:
+        if nom not in evenements_possibles:
+            raise RuntimeError("Evénement inconnu : {}".format(nom))
+    rien = lambda *args: None
+    ecoute_instruction, ecoute_ecriture, ecoute_appel, ecoute_retour, ecoute_affichage, ecoute_erreur = (
+        ecouteurs.get(nom, rien) for nom in evenements_possibles)
+
+    registres = {reg: 0 for reg in noms_registres}
+    verifie = taille is None
+    memoire = [0] * (256 if verifie else taille)
+    cache = OrderedDict()
+    en_cours = []
+
+    try:
+        while registres["rip"] < len(programme):
+            dest, op, source = programme[registres["rip"]]
+            ecoute_instruction(registres["rip"], (dest, op, source), registres)
+
+            ecrit = None  # adresse écrite par l'instruction
+            if op == "const":
+                registres[dest] = source
+            elif op == "copy":
+                registres[dest] = registres[source]
+                if dest == "rip":
+                    appel_instrumente(registres, memoire, pures, cache, en_cours, ecoute_appel, ecoute_retour)
+            elif op == "add":
+                registres[dest] += registres[source]
+            elif op == "sub":
+                registres[dest] -= registres[source]
+            elif op == "mul":
+                registres[dest] *= registres[source]
+            elif op == "print":
+                print(registres[source])
+                ecoute_affichage(registres[source])
+            elif op == "load":
+                if verifie:
+                    verifie_adresse(registres[source], memoire, registres)
+                registres[dest] = memoire[registres[source]]
+                if dest == "rip":
+                    if en_cours and en_cours[-1][1] == registres["rsp"]:
+                        cache[en_cours.pop()[0]] = registres["rax"]
+                        if len(cache) > taille_cache:
+                            cache.popitem(last=False)
+                    ecoute_retour(registres["rip"], registres["rax"])
+            elif op == "store":
+                if verifie:
+                    verifie_adresse(registres[dest], memoire, registres)
+                memoire[registres[dest]] = registres[source]
+                ecrit = registres[dest]
+            elif op == "addinz":
+                if registres[dest] != 0:
+                    registres["rip"] += registres[source]
+            elif op == "push":
+                if verifie:
+                    verifie_adresse(registres["rsp"], memoire, registres)
+                memoire[registres["rsp"]] = registres[source]
+                ecrit = registres["rsp"]
+                registres["rsp"] += 1
+            elif op == "pop":
+                registres["rsp"] -= 1
+                if verifie:
+                    verifie_adresse(registres["rsp"], memoire, registres)
+                registres[source] = memoire[registres["rsp"]]
+                if source == "rip":
+                    ecoute_retour(registres["rip"], registres["rax"])
+            elif op == "call":
+                if verifie:
+                    verifie_adresse(registres["rsp"], memoire, registres)
+                memoire[registres["rsp"]] = registres["rip"]
+                ecrit = registres["rsp"]
+                registres["rsp"] += 1
+                registres["rip"] = source - 1
+                appel_instrumente(registres, memoire, pures, cache, en_cours, ecoute_appel, ecoute_retour)
+            elif op == "ret":
+                registres["rsp"] -= 1
+                if verifie:
+                    verifie_adresse(registres["rsp"], memoire, registres)
+                registres["rip"] = memoire[registres["rsp"]]
+                if en_cours and en_cours[-1][1] == registres["rsp"]:
+                    cache[en_cours.pop()[0]] = registres["rax"]
+                    if len(cache) > taille_cache:
+                        cache.popitem(last=False)
+                ecoute_retour(registres["rip"], registres["rax"])
+
+            if ecrit is not None:
+                ecoute_ecriture(ecrit, memoire[ecrit])
+            registres["rip"] += 1
+    except Exception as erreur:
+        ecoute_erreur(erreur, registres, memoire)
+        raise
+
+def appel_instrumente(registres, memoire, pures, cache, en_cours, ecoute_appel, ecoute_retour):
+    cible = registres["rip"]
+    ecoute_appel(cible + 1, registres["rsp"])
+    if pures is not None:
+        appel_pur(registres, memoire, pures, cache, en_cours)
+        if registres["rip"] != cible:
+            # Résultat déjà dans le cache : on est directement revenu de la fonction
+            ecoute_retour(registres["rip"], registres["rax"])
+
+
+def traceur(taille=1000, sortie=sys.stderr):
+    """
+    Renvoie des écouteurs (à donner à execute()) qui gardent les taille derniers événements, et la file qui les
+    contient. Si l'exécution plante (par exemple en sortant de la mémoire), ils sont affichés dans sortie.
+    >>> ecouteurs, evenements = traceur(100)
+    >>> interprete(asm, ecouteurs=ecouteurs)
+    """
+    evenements = deque(maxlen=taille)  # les plus anciens sont oubliés automatiquement
+    ecouteurs = {
+        "instruction": lambda rip, instr, registres: evenements.append(("instruction", rip, texte_instr(*instr))),
+        "ecriture": lambda adresse, valeur: evenements.append(("ecriture", adresse, valeur)),
+        "appel": lambda adresse, rsp: evenements.append(("appel", adresse, rsp)),
+        "retour": lambda adresse, rax: evenements.append(("retour", adresse, rax)),
+        "affichage": lambda valeur: evenements.append(("affichage", valeur)),
+        "erreur": lambda erreur, registres, memoire: affiche_evenements(evenements, erreur, registres, sortie),
+    }
+    return ecouteurs, evenements
+
+def affiche_evenements(evenements, erreur, registres, sortie=sys.stderr):
+    print("Erreur : {}".format(erreur), file=sortie)
+    print("{} derniers événements :".format(len(evenements)), file=sortie)
+    for evenement in evenements:
+        nom = evenement[0]
+        if nom == "instruction":
+            texte = "{:>6} : {}".format(evenement[1], print_instr(evenement[2]))
+        elif nom == "ecriture":
+            texte = "         mémoire[{}] <- {}".format(evenement[1], evenement[2])
+        elif nom == "appel":
+            texte = "         appel de la fonction en {} (rsp = {})".format(evenement[1], evenement[2])
+        elif nom == "retour":
+            texte = "         retour en {} (rax = {})".format(evenement[1] + 1, evenement[2])
+        else:
+            texte = "         affiche {}".format(evenement[1])
+        print(texte, file=sortie)
+    print("Registres : {}".format(registres), file=sortie)
+
+
+def verifie_adresse(adresse, memoire, registres):
+    if not 0 <= adresse < len(memoire):
+        raise RuntimeError("Accès mémoire en dehors de la mémoire à la ligne {} : adresse {} (taille {})".format(
+            registres["rip"], adresse, len(memoire)))
+
+
+def appel_pur(registres, memoire, pures, cache, en_cours):
+    """
+    Appelé à chaque saut vers une fonction (rip <- copy rax ou call, voir compile_appel()).
+    La pile contient alors les arguments, puis l'adresse de retour.
+    Si le résultat est déjà dans le cache, on fait directement le retour, sinon on se souvient de l'appel pour
+    enregistrer le résultat au moment du retour (rip <- load (rsp) ou ret, voir compile_renvoyer()).
+    """
+    adresse = registres["rip"] + 1
+    if adresse not in pures:
+        return
+
+    rsp = registres["rsp"]
+    appel = adresse, tuple(memoire[rsp - 1 - pures[adresse]:rsp - 1])
+    if appel in cache:
+        cache.move_to_end(appel)
+        registres["rax"] = cache[appel]
+        registres["rsp"] = rsp - 1
+        registres["rip"] = memoire[rsp - 1]
+    else:
+        en_cours.append((appel, rsp - 1))
+
+
+# Affiche joliment des instructions assembleur (texte, ou liste déjà décodée), une par une, dans sortie
+# (n'importe quel fichier, par défaut la sortie standard).
+def print_asm(asm, sortie=None):
+    if sortie is None:
+        sortie = sys.stdout
+    if type(asm) == str:
+        asm = (decode_instr(ligne) for ligne in filter(None, asm.split('\n')))
+    for instr in asm:
+        sortie.write(print_instr(texte_instr(*instr)) + '\n')
 
-# Affiche joliment des instructions assembleur.
-def print_asm(asm):
-    lignes = list(filter(None, asm.split('\n')))
-    for ligne in lignes:
-        print(print_instr(ligne))
+# Reconstruit le texte d'une instruction décodée.
+def texte_instr(dest, op, source):
+    if op == "ret":
+        return "ret"
+    if op in ("print", "push", "pop", "call"):
+        return "{} {}".format(op, source)
+    if op == "load":
+        source = "({})".format(source)
+    elif op == "store":
+        dest = "({})".format(dest)
+    return "{} <- {} {}".format(dest, op, source)
 
 def print_instr(instr):
     operandes = instr.split()
 
-    if len(operandes) == 2: # print est un cas à part
+    if len(operandes) == 1: # ret n'a pas d'opérande
+        operandes = ['', ''] + operandes + ['']
+    if len(operandes) == 2: # print (et push, pop, call) est un cas à part
         operandes = ['', ''] + operandes
 
     dest = operandes[0]
@@ -0,0 +1,245 @@
+"""
+Interprète assembleur avec compilation à la volée (JIT) des chemins les plus exécutés.
+
+Utilisation :
+>>> import jit
+>>> jit.interprete(asm)
+>>> print(jit.sources[12])  # code Python généré pour la trace qui commence à l'instruction 12
+
+Il n'y a pas de boucle dans le langage, mais les fonctions récursives (comme multiplication dans p6.code) exécutent
+très souvent les mêmes suites d'instructions. A chaque fois, interprete_asm.py redécouvre la même chose :
+chercher l'instruction, regarder son opération, lire et écrire les registres dans un dictionnaire...
+
+Ici, on compte combien de fois on saute à chaque adresse (à chaque écriture dans rip). Quand une adresse a été
+atteinte seuil fois, on enregistre le chemin suivi à partir d'elle (la trace) en continuant d'exécuter normalement,
+jusqu'à revenir à son début, atteindre une autre trace, ou avoir enregistré limite instructions.
+La trace est alors traduite en une fonction Python, où les registres sont des variables locales et où chaque
+instruction est une simple ligne de Python. Les prochaines fois que l'on arrive à cette adresse, on appelle
+directement la fonction.
+
+Rien ne dit que la prochaine exécution suivra le même chemin : à chaque saut, la fonction vérifie que l'on va bien
+au même endroit que lors de l'enregistrement (c'est une garde). Sinon, elle remet les registres dans le
+dictionnaire et rend la main à la boucle normale, à l'adresse où l'on devait aller.
+Si la mémoire n'a pas une taille prouvée suffisante (voir interprete_asm.execute()), chaque accès mémoire est aussi
+gardé : en cas de débordement, c'est la boucle normale qui exécute l'instruction et signale l'erreur.
+
+Le cache des fonctions pures (paramètre pures de interprete_asm.execute()) n'est pas géré dans ce mode.
+"""
+
+import interprete_asm
+from interprete_asm import verifie_adresse
+
+
+sources = {}  # sources[adresse] contient le code Python de la trace qui commence à cette adresse
+
+registres_locaux = [reg for reg in interprete_asm.noms_registres if reg != "rip"]
+
+
+def interprete(instructions, seuil=50, limite=500, entrees=None):
+    execute(interprete_asm.decode(instructions), seuil, limite, entrees)
+
+def execute(programme, seuil=50, limite=500, entrees=None):
+    """
+    Exécute une liste d'instructions déjà décodées, comme interprete_asm.execute().
+    seuil : nombre de sauts vers une adresse à partir duquel on enregistre une trace
+    limite : nombre maximal d'instructions d'une trace
+    entrees : adresse de toutes les fonctions, pour prouver la taille de mémoire (voir interprete_asm.taille_prouvee())
+    """
+    registres = {reg: 0 for reg in interprete_asm.noms_registres}
+    taille = interprete_asm.taille_prouvee(programme, entrees)
+    verifie = taille is None
+    memoire = [0] * (256 if verifie else taille)
+
+    sources.clear()
+    traces = {}  # traces[adresse] : fonction compilée pour la trace qui commence à cette adresse
+    compteurs = {}  # compteurs[adresse] : nombre de sauts vers cette adresse
+    trace = None  # adresses des instructions de la trace en cours d'enregistrement
+
+    # Contrairement à interprete_asm.py, registres["rip"] contient ici l'adresse de la prochaine instruction à
+    # exécuter : l'incrémentation est faite par execute_instr().
+    while registres["rip"] < len(programme):
+        rip = registres["rip"]
+        if trace is None and rip in traces:
+            # Une trace rend la main après un saut (quand une garde échoue) : l'adresse où l'on va peut à son tour
+            # devenir le début d'une trace.
+            traces[rip](registres, memoire)
+            saut = True
+            if registres["rip"] == rip:
+                # Une garde a échoué dès la première instruction (par exemple un accès en dehors de la mémoire) :
+                # relancer la trace recommencerait pour toujours. On exécute cette instruction normalement, ce qui
+                # signale l'erreur s'il y en a une.
+                saut = execute_instr(programme[rip], registres, memoire, verifie)
+        else:
+            if trace is not None:
+                trace.append(rip)
+            saut = execute_instr(programme[rip], registres, memoire, verifie)
+        suivante = registres["rip"]
+
+        if trace is not None:
+            if suivante == trace[0] or suivante in traces or len(trace) >= limite or suivante >= len(programme):
+                sources[trace[0]] = compile_trace(programme, trace, suivante, verifie)
+                traces[trace[0]] = cree_fonction(sources[trace[0]])
+                trace = None
+        elif saut and suivante not in traces:
+            compteurs[suivante] = compteurs.get(suivante, 0) + 1
+            if compteurs[suivante] >= seuil:
+                trace = []
+
+
+def execute_instr(instr, registres, memoire, verifie):
+    """Exécute une instruction, comme la boucle de interprete_asm.execute(). Renvoie True si rip a été modifié."""
+    dest, op, source = instr
+    rip = registres["rip"]
+    if op == "const":
+        registres[dest] = source
+    elif op == "copy":
+        registres[dest] = registres[source]
+    elif op == "add":
+        registres[dest] += registres[source]
+    elif op == "sub":
+        registres[dest] -= registres[source]
+    elif op == "mul":
+        registres[dest] *= registres[source]
+    elif op == "print":
+        print(registres[source])
+    elif op == "load":
+        if verifie:
+            verifie_adresse(registres[source], memoire, registres)
+        registres[dest] = memoire[registres[source]]
+    elif op == "store":
+        if verifie:
+            verifie_adresse(registres[dest], memoire, registres)
+        memoire[registres[dest]] = registres[source]
+    elif op == "addinz":
+        if registres[dest] != 0:
+            registres["rip"] += registres[source]
+    elif op == "push":
+        if verifie:
+            verifie_adresse(registres["rsp"], memoire, registres)
+        memoire[registres["rsp"]] = registres[source]
+        registres["rsp"] += 1
+    elif op == "pop":
+        registres["rsp"] -= 1
+        if verifie:
+            verifie_adresse(registres["rsp"], memoire, registres)
+        registres[source] = memoire[registres["rsp"]]
+    elif op == "call":
+        if verifie:
+            verifie_adresse(registres["rsp"], memoire, registres)
+        memoire[registres["rsp"]] = rip
+        registres["rsp"] += 1
+        registres["rip"] = source - 1
+    elif op == "ret":
+        registres["rsp"] -= 1
+        if verifie:
+            verifie_adresse(registres["rsp"], memoire, registres)
+        registres["rip"] = memoire[registres["rsp"]]
+
+    saut = registres["rip"] != rip
+    registres["rip"] += 1
+    return saut
+
+
+# Compilation d'une trace en Python.
+# Par exemple, la trace 12, 13, 14 :
+# 12: rax <- const 3
+# 13: rbx <- load (rsp)
+# 14: rip <- copy rbx
+# devient (sans vérification de la mémoire) :
+# def trace(r, m):
+#     rsp, rbp, rsi, rdi, rax, rbx, rcx, rdx = r["rsp"], r["rbp"], ...
+#     rax = 3
+#     rbx = m[rsp]
+#     s = rbx + 1
+#     if s != 40: r.update(rip=s, rsp=rsp, rbp=rbp, ...); return
+#     r.update(rip=40, rsp=rsp, rbp=rbp, ...); return
+# où 40 est l'adresse à laquelle on est allé depuis l'instruction 14 pendant l'enregistrement.
+# Si la trace revient à son début, tout le corps est dans une boucle 'while True'.
+
+def compile_trace(programme, trace, fin, verifie):
+    """
+    trace : adresses des instructions exécutées, dans l'ordre
+    fin : adresse de l'instruction exécutée juste après
+    verifie : s'il faut vérifier chaque accès à la mémoire
+    """
+    boucle = fin == trace[0]
+    indentation = "        " if boucle else "    "
+    lignes = ["def trace(r, m):",
+              "    {} = {}".format(", ".join(registres_locaux), ", ".join('r["{}"]'.format(reg) for reg in registres_locaux))]
+    if boucle:
+        lignes.append("    while True:")
+    for i, adresse in enumerate(trace):
+        suivante = trace[i + 1] if i + 1 < len(trace) else fin
+        for ligne in compile_instr(programme[adresse], adresse, suivante, verifie):
+            lignes.append(indentation + ligne)
+    if not boucle:
+        lignes.append(indentation + sortie(fin))
+    return "\n".join(lignes) + "\n"
+
+def cree_fonction(source):
+    variables = {}
+    exec(source, variables)
+    return variables["trace"]
+
+def sortie(adresse):
+    """Remet les registres dans le dictionnaire et rend la main à la boucle normale, à l'adresse donnée."""
+    return "r.update(rip={}, {}); return".format(adresse, ", ".join("{0}={0}".format(reg) for reg in registres_locaux))
+
+def compile_instr(instr, adresse, suivante, verifie):
+    """
+    Lignes Python pour une instruction de la trace. suivante est l'adresse où l'on est allé ensuite pendant
+    l'enregistrement : si l'instruction modifie rip, on vérifie que l'on y va encore.
+    """
+    dest, op, source = instr
+    lit = lambda reg: str(adresse) if reg == "rip" else reg  # lire rip donne l'adresse de l'instruction
+    garde_memoire = lambda a: ["if not 0 <= {} < len(m): {}".format(a, sortie(adresse))] if verifie else []
+
+    lignes = []
+    nouveau_rip = None  # expression de l'adresse de la prochaine instruction, si l'instruction modifie rip
+    if op == "const":
+        if dest == "rip":
+            return [] # Saut vers une adresse connue : on sait déjà que c'est suivante
+        lignes.append("{} = {}".format(dest, source))
+    elif op in ("copy", "add", "sub", "mul"):
+        valeur = lit(source)
+        if op != "copy":
+            valeur = "{} {} {}".format(lit(dest), {"add": "+", "sub": "-", "mul": "*"}[op], valeur)
+        if dest == "rip":
+            nouveau_rip = "{} + 1".format(valeur)
+        else:
+            lignes.append("{} = {}".format(dest, valeur))
+    elif op == "print":
+        lignes.append("print({})".format(lit(source)))
+    elif op == "load":
+        lignes += garde_memoire(lit(source))
+        if dest == "rip":
+            nouveau_rip = "m[{}] + 1".format(lit(source))
+        else:
+            lignes.append("{} = m[{}]".format(dest, lit(source)))
+    elif op == "store":
+        lignes += garde_memoire(lit(dest))
+        lignes.append("m[{}] = {}".format(lit(dest), lit(source)))
+    elif op == "addinz":
+        nouveau_rip = "{0} + 1 + {1} if {2} != 0 else {0} + 1".format(adresse, lit(source), lit(dest))
+    elif op == "push":
+        lignes += garde_memoire("rsp")
+        lignes += ["m[rsp] = {}".format(lit(source)), "rsp += 1"]
+    elif op == "pop":
+        lignes += garde_memoire("rsp - 1")
+        lignes.append("rsp -= 1")
+        if source == "rip":
+            nouveau_rip = "m[rsp] + 1"
+        else:
+            lignes.append("{} = m[rsp]".format(source))
+    elif op == "call":
+        lignes += garde_memoire("rsp")
+        lignes += ["m[rsp] = {}".format(adresse), "rsp += 1"]
+    elif op == "ret":
+        lignes += garde_memoire("rsp - 1")
+        lignes.append("rsp -= 1")
+        nouveau_rip = "m[rsp] + 1"
+
+    if nouveau_rip is not None:
+        lignes.append("s = {}".format(nouveau_rip))
+        lignes.append("if s != {}: {}".format(suivante, sortie("s")))
+    return lignes
@@ -0,0 +1,192 @@
+"""
+Compile un programme et l'exécute.
+Utilisation :
+>>> from main import *
+>>> test('AFFICHER((3 + 2) * 6 + 12)')
+>>> test(gros_programme, silencieux=True)  # sans afficher l'arbre ni l'assembleur, avec le temps de chaque étape
+
+On peut aussi exécuter plusieurs fichiers d'un coup depuis un terminal, en parallèle :
+python main.py ../exemples --jobs 4
+python main.py p1.code p2.code --manifeste liste.txt --optimise
+Chaque argument est un fichier .code ou un dossier (dont on prend tous les fichiers .code), et le manifeste
+est un fichier texte qui contient un chemin par ligne.
+Pour chaque fichier, dès qu'il est terminé, une ligne JSON est affichée avec le nom du fichier, ce qu'a affiché
+le programme, l'erreur éventuelle et le temps passé dans chaque étape (en secondes).
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+import parser, compile, interprete_asm, evalue
+
+def test(prog, cpl=compile.compile, direct=False, silencieux=False):
+    """
+    Affiche chaque étape. Avec direct=True, l'AST est évalué directement, sans passer par l'assembleur.
+    Avec silencieux=True, on n'affiche ni le programme, ni l'arbre, ni l'assembleur (pour un gros programme, cela
+    prendrait plus de temps que le reste) : seulement ce qu'affiche le programme, puis le temps passé dans chaque
+    étape, le nombre de noeuds de l'arbre et la taille du code assembleur (en instructions, pas celles exécutées :
+    les compter ralentirait l'exécution mesurée). Ces mesures sont aussi renvoyées.
+    """
+    mesures = {}
+    if not silencieux:
+        print('Programme :')
+        print(prog)
+        print('')
+
+    debut = time.perf_counter()
+    ast = parser.parse(prog)
+    mesures["parse"] = {"temps": time.perf_counter() - debut, "noeuds": compte_noeuds(ast)}
+    if not silencieux:
+        print('Arbre :')
+        parser.print_ast(ast)
+        print('')
+
+    if direct:
+        if not silencieux:
+            print('Exécution (directe) :')
+        debut = time.perf_counter()
+        evalue.evalue(ast)
+        mesures["execution"] = {"temps": time.perf_counter() - debut}
+    else:
+        debut = time.perf_counter()
+        asm = cpl(ast)
+        mesures["compile"] = {"temps": time.perf_counter() - debut, "taille": asm.count('\n')}
+        if not silencieux:
+            print('Assembleur :')
+            interprete_asm.print_asm(asm)
+            print('')
+
+        if not silencieux:
+            print('Exécution :')
+        debut = time.perf_counter()
+        interprete_asm.interprete(asm)
+        mesures["execution"] = {"temps": time.perf_counter() - debut}
+
+    if silencieux:
+        print('')
+        for etape, mesure in mesures.items():
+            ligne = "{:<10} {:9.6f} s".format(etape, mesure["temps"])
+            if "noeuds" in mesure:
+                ligne += "  {} noeuds".format(mesure["noeuds"])
+            if "taille" in mesure:
+                ligne += "  code de {} instructions".format(mesure["taille"])
+            print(ligne)
+        return mesures
+
+def compte_noeuds(ast):
+    """Nombre de noeuds (tuples) de l'arbre"""
+    if type(ast) == tuple:
+        return 1 + sum(compte_noeuds(a) for a in ast)
+    if type(ast) == list:
+        return sum(compte_noeuds(a) for a in ast)
+    return 0
+
+
+def execute_fichier(chemin, optimise=False, registres=False):
+    """Lit, compile et exécute un fichier, et renvoie le résultat sous forme de dictionnaire."""
+    try:
+        with open(chemin) as f:
+            prog = f.read()
+    except OSError as e:
+        return {"fichier": chemin, "sortie": "", "erreur": "{} (lecture) : {}".format(type(e).__name__, e), "temps": {}}
+    return dict({"fichier": chemin}, **execute_programme(prog, optimise, registres))
+
+def execute_programme(prog, optimise=False, registres=False, jusqua="execution"):
+    """
+    Compile et exécute un programme, et renvoie le résultat sous forme de dictionnaire.
+    Avec jusqua="parse" (ou "compile"), on s'arrête après cette étape, et le résultat contient aussi l'AST
+    (ou le code assembleur).
+    """
+    resultat = {"sortie": "", "erreur": None, "temps": {}}
+    sortie = io.StringIO()
+    etape = "parse"
+    debut = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(sortie):
+            ast = parser.parse(prog)
+            resultat["temps"]["parse"] = time.perf_counter() - debut
+            if jusqua == "parse":
+                resultat["ast"] = ast
+                return resultat
+
+            etape = "compile"
+            debut = time.perf_counter()
+            asm = compile.compile(ast, optimise=optimise, registres=registres)
+            resultat["temps"]["compile"] = time.perf_counter() - debut
+            if jusqua == "compile":
+                resultat["asm"] = asm
+                return resultat
+
+            etape = "execution"
+            debut = time.perf_counter()
+            interprete_asm.interprete(asm, entrees=compile.entrees)
+            resultat["temps"]["execution"] = time.perf_counter() - debut
+    except Exception as e:
+        resultat["temps"][etape] = time.perf_counter() - debut
+        resultat["erreur"] = "{} ({}) : {}".format(type(e).__name__, etape, e)
+    finally:
+        resultat["sortie"] = sortie.getvalue()
+    return resultat
+
+def liste_fichiers(chemins, manifeste=None):
+    fichiers = []
+    if manifeste is not None:
+        with open(manifeste) as f:
+            chemins = list(chemins) + [ligne.strip() for ligne in f if ligne.strip()]
+    for chemin in chemins:
+        if os.path.isdir(chemin):
+            fichiers += sorted(os.path.join(chemin, nom) for nom in os.listdir(chemin) if nom.endswith('.code'))
+        else:
+            fichiers.append(chemin)
+    return fichiers
+
+def execute_fichiers(fichiers, jobs=None, optimise=False, registres=False, sortie=sys.stdout):
+    """
+    Exécute les fichiers sur jobs processus (autant que de coeurs par défaut), et écrit une ligne JSON par fichier
+    dans sortie dès qu'il est terminé. Renvoie le nombre de fichiers en erreur.
+    """
+    erreurs = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executeur:
+        resultats = [executeur.submit(execute_fichier, f, optimise, registres) for f in fichiers]
+        for resultat in concurrent.futures.as_completed(resultats):
+            resultat = resultat.result()
+            if resultat["erreur"] is not None:
+                erreurs += 1
+            sortie.write(json.dumps(resultat, ensure_ascii=False) + '\n')
+            sortie.flush()
+    return erreurs
+
+def entier_positif(texte):
+    """Type argparse : un entier strictement positif (comme le nombre de processus)."""
+    try:
+        n = int(texte)
+    except ValueError:
+        raise argparse.ArgumentTypeError("entier attendu : {}".format(texte))
+    if n <= 0:
+        raise argparse.ArgumentTypeError("doit être strictement positif : {}".format(n))
+    return n
+
+def main(arguments=None):
+    analyseur = argparse.ArgumentParser(description="Compile et exécute des fichiers .code en parallèle.")
+    analyseur.add_argument('chemins', nargs='*', help="fichiers .code ou dossiers")
+    analyseur.add_argument('--manifeste', help="fichier contenant un chemin par ligne")
+    analyseur.add_argument('--jobs', '-j', type=entier_positif, default=None, help="nombre de processus (défaut : nombre de coeurs)")
+    analyseur.add_argument('--optimise', action='store_true', help="optimise l'AST avant de compiler")
+    analyseur.add_argument('--registres', action='store_true', help="passe les arguments dans les registres")
+    options = analyseur.parse_args(arguments)
+
+    try:
+        fichiers = liste_fichiers(options.chemins, options.manifeste)
+    except OSError as e:
+        analyseur.error("manifeste illisible : {}".format(e))
+    erreurs = execute_fichiers(fichiers, options.jobs, options.optimise, options.registres)
+    return 1 if erreurs else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+Format objet binaire pour les programmes compilés.
+Plutôt que de garder la sortie texte du compilateur (qu'il faut redécouper à chaque chargement), on peut l'enregistrer
+dans un fichier binaire, que l'on relit ensuite directement sous forme d'instructions décodées.
+
+Utilisation :
+>>> import parser, objet
+>>> objet.compile_objet(parser.parse(code), 'p6.obj')
+>>> objet.execute_objet('p6.obj')
+
+Contenu du fichier (entiers en little-endian), dans la version 2 du format :
+- un en-tête : 'IPTO', la version du format (2 octets), le nombre de variables globales (4 octets),
+  le nombre d'instructions (4 octets) et le nombre de fonctions (4 octets) ;
+- les instructions, toutes de la même taille (10 octets) : le numéro de l'opération, le numéro du registre
+  destination (255 s'il n'y en a pas, comme pour print), puis la source sur 8 octets (le numéro du registre source,
+  255 s'il n'y en a pas, ou la valeur de la constante pour 'const' et de l'adresse pour 'call') ;
+- la table des symboles : pour chaque fonction (y compris celles qui ont été redéfinies, voir compile.entrees),
+  son adresse (4 octets), la longueur de son nom (2 octets), puis son nom en UTF-8.
+Les numéros des opérations et des registres sont leur position dans les listes de interprete_asm.py.
+
+La version 1 ne connaissait pas push, pop, call et ret (numéros 9 à 12) : la source y était toujours un registre ou
+une constante. Ses fichiers sont donc aussi des fichiers de la version 2, et on sait toujours les lire. En revanche,
+un ancien chargeur refuse proprement un fichier de la version 2, au lieu de se tromper sur ses instructions.
+"""
+
+import mmap
+import struct
+
+import compile
+import interprete_asm
+from interprete_asm import operations, noms_registres
+
+
+MAGIQUE = b'IPTO'
+VERSION = 2
+VERSIONS_LUES = (1, 2)  # voir plus haut : la version 1 est un cas particulier de la version 2
+
+format_entete = struct.Struct('<4sHIII')
+format_instr = struct.Struct('<BBq')
+format_symbole = struct.Struct('<IH')
+
+PAS_DE_REGISTRE = 255
+VALEUR_MIN, VALEUR_MAX = -2 ** 63, 2 ** 63 - 1  # la source est un entier signé sur 8 octets
+
+
+def encode_instr(dest, op, source):
+    if op == "const" or op == "call":
+        valeur = source
+        if not VALEUR_MIN <= valeur <= VALEUR_MAX:
+            raise RuntimeError("Constante trop grande pour le format objet (8 octets signés) : {}".format(valeur))
+    elif source:
+        valeur = noms_registres.index(source)
+    else:
+        valeur = PAS_DE_REGISTRE
+    numero_dest = noms_registres.index(dest) if dest else PAS_DE_REGISTRE
+    return format_instr.pack(operations.index(op), numero_dest, valeur)
+
+def decode_instr(numero_op, numero_dest, valeur):
+    op = operations[numero_op]
+    dest = noms_registres[numero_dest] if numero_dest != PAS_DE_REGISTRE else ''
+    if op == "const" or op == "call":
+        source = valeur
+    else:
+        source = noms_registres[valeur] if valeur != PAS_DE_REGISTRE else ''
+    return dest, op, source
+
+
+def ecrit_objet(chemin, programme, entrees, nb_globales):
+    """
+    Ecrit un fichier objet.
+    programme est soit le texte assembleur, soit la liste déjà décodée (voir interprete_asm.decode()),
+    entrees associe à l'adresse de chaque fonction son nom (comme compile.entrees).
+    """
+    if type(programme) == str:
+        programme = interprete_asm.decode(programme)
+
+    # On encode tout avant d'ouvrir le fichier : une constante trop grande ne laisse pas un fichier à moitié écrit.
+    instrs = b''.join(encode_instr(*instr) for instr in programme)
+    with open(chemin, 'wb') as f:
+        f.write(format_entete.pack(MAGIQUE, VERSION, nb_globales, len(programme), len(entrees)))
+        f.write(instrs)
+        for adresse, nom in entrees.items():
+            nom = nom.encode('utf-8')
+            f.write(format_symbole.pack(adresse, len(nom)) + nom)
+
+def charge_objet(chemin):
+    """
+    Charge un fichier objet, en le projetant en mémoire (mmap) : aucun texte n'est relu.
+    Renvoie le triplet (programme décodé, nom de la fonction à chaque adresse, nombre de variables globales).
+    """
+    with open(chemin, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as donnees:
+        if len(donnees) < format_entete.size:
+            raise RuntimeError("Fichier objet tronqué : {}".format(chemin))
+        magique, version, nb_globales, nb_instrs, nb_fonctions = format_entete.unpack_from(donnees, 0)
+        if magique != MAGIQUE:
+            raise RuntimeError("Ce n'est pas un fichier objet : {}".format(chemin))
+        if version not in VERSIONS_LUES:
+            raise RuntimeError("Version du format objet non supportée : {}".format(version))
+
+        debut = format_entete.size
+        fin = debut + nb_instrs * format_instr.size
+        if len(donnees) < fin:
+            raise RuntimeError("Fichier objet tronqué : {}".format(chemin))
+        with memoryview(donnees) as vue, vue[debut:fin] as instrs:
+            programme = [decode_instr(*instr) for instr in format_instr.iter_unpack(instrs)]
+
+        entrees = {}
+        position = fin
+        for _ in range(nb_fonctions):
+            if len(donnees) < position + format_symbole.size:
+                raise RuntimeError("Fichier objet tronqué : {}".format(chemin))
+            adresse, longueur = format_symbole.unpack_from(donnees, position)
+            position += format_symbole.size
+            if len(donnees) < position + longueur:
+                raise RuntimeError("Fichier objet tronqué : {}".format(chemin))
+            entrees[adresse] = donnees[position:position + longueur].decode('utf-8')
+            position += longueur
+
+    return programme, entrees, nb_globales
+
+
+def compile_objet(ast, chemin):
+    """Compile un AST et enregistre le résultat dans un fichier objet."""
+    asm = compile.compile(ast)
+    ecrit_objet(chemin, asm, compile.entrees, len(compile.variables))
+
+def execute_objet(chemin):
+    programme, entrees, _ = charge_objet(chemin)
+    interprete_asm.execute(programme, entrees=entrees)
@@ -0,0 +1,353 @@
+"""
+Optimisations de l'AST, effectuées avant la compilation.
+Chaque optimisation prend un AST et renvoie un nouvel AST équivalent (l'AST de départ n'est pas modifié).
+
+Utilisation :
+>>> import parser, optimisations
+>>> ast = optimisations.optimise(parser.parse(code))
+ou directement :
+>>> compile.compile(ast, optimise=True)
+"""
+
+
+def optimise(ast):
+    """Effectue toutes les optimisations, dans l'ordre (c'est ce que fait compile.compile(ast, optimise=True))."""
+    return elimine_code_mort(remplace_appels(ast))
+
+
+def elimine_code_mort(ast):
+    """
+    Enlève le code qui ne sert à rien :
+    - les SI dont la condition est connue à la compilation (le bloc est gardé sans le test, ou enlevé entièrement),
+      et les instructions qui suivent un RENVOYER,
+    - les fonctions qui ne sont jamais appelées,
+    - les affectations de variables qui ne sont jamais lues (ce qui économise aussi leur place en mémoire).
+    Enlever une fonction ou une affectation peut rendre inutile une autre variable : on recommence tant que
+    l'AST change.
+    """
+    while True:
+        nouveau = elimine_variables_inutiles(elimine_fonctions_inutiles(simplifie_conditions(ast)))
+        if nouveau == ast:
+            return ast
+        ast = nouveau
+
+
+# Conditions connues à la compilation
+
+def valeur_constante(ast):
+    """Renvoie la valeur de l'expression si elle ne contient que des entiers, None sinon."""
+    type = ast[0]
+    if type == "ENTIER":
+        return int(ast[1])
+    elif type in ("PLUS", "MOINS", "FOIS", "EGALE"):
+        a, b = valeur_constante(ast[1]), valeur_constante(ast[2])
+        if a is None or b is None:
+            return None
+        if type == "PLUS":
+            return a + b
+        elif type == "FOIS":
+            return a * b
+        return a - b # MOINS, ou EGALE (qui vaut 0 si les deux côtés sont égaux, voir compile_egale())
+    return None
+
+def simplifie_conditions(ast, visibles=None):
+    """visibles : noms des variables qui existent déjà (complété au fur et à mesure des affectations)"""
+    if visibles is None:
+        visibles = set()
+    type = ast[0]
+    if type == "BLOC":
+        return "BLOC", simplifie_instructions(ast[1], visibles)
+    elif type == "FONCTION":
+        return "FONCTION", ast[1], ast[2], simplifie_conditions(ast[3], visibles | set(ast[2]))
+    elif type == "CONDITION":
+        return "CONDITION", ast[1], simplifie_conditions(ast[2], visibles)
+    elif type == "AFFECTATION":
+        visibles.add(ast[1])
+    return ast
+
+def simplifie_instructions(asts, visibles):
+    instructions = []
+    for i, ast in enumerate(asts):
+        if ast[0] == "CONDITION":
+            test = valeur_constante(ast[1])
+            if test is not None:
+                # La condition est vraie si le test vaut 0 : on garde alors les instructions du bloc sans le test.
+                # Sinon on n'en garde que ce qui existe même si le bloc n'est jamais exécuté (voir declarations()).
+                if test == 0:
+                    instructions += simplifie_conditions(ast[2], visibles)[1]
+                else:
+                    instructions += declarations(ast[2], visibles)
+                continue
+        ast = simplifie_conditions(ast, visibles)
+        instructions.append(ast)
+
+        # Rien n'est exécuté après un RENVOYER : comme pour un SI toujours faux, on ne garde de la suite que ce qui
+        # existe dès la compilation (voir declarations()).
+        if ast[0] == "RENVOYER":
+            for a in asts[i + 1:]:
+                instructions += declarations(a, visibles)
+            break
+    return instructions
+
+def declarations(ast, visibles):
+    """
+    Ce qu'il reste d'un bloc qui n'est jamais exécuté : les fonctions qu'il déclare, et ses variables, que
+    compile.py crée même si le bloc n'est pas exécuté (une variable globale vaut alors 0). On garde donc une
+    affectation à 0 pour chaque variable qui n'existe pas déjà, dans l'ordre du bloc (une fonction déclarée après
+    l'affectation voit la variable).
+    """
+    if ast[0] == "BLOC":
+        return [d for a in ast[1] for d in declarations(a, visibles)]
+    elif ast[0] == "CONDITION":
+        return declarations(ast[2], visibles)
+    elif ast[0] == "FONCTION":
+        return [simplifie_conditions(ast, visibles)]
+    elif ast[0] == "AFFECTATION" and ast[1] not in visibles:
+        visibles.add(ast[1])
+        return [("AFFECTATION", ast[1], ("ENTIER", "0"))]
+    return []
+
+
+# Fonctions jamais appelées
+
+def elimine_fonctions_inutiles(ast):
+    declarations = {}  # declarations["f"] contient la liste des déclarations des fonctions nommées f
+    cherche_declarations(ast, declarations)
+
+    # On part des appels du programme principal, puis on ajoute les fonctions appelées par les fonctions atteintes.
+    atteintes = set()
+    a_visiter = appels(ast)
+    while a_visiter:
+        nom = a_visiter.pop()
+        if nom in atteintes:
+            continue
+        atteintes.add(nom)
+        for declaration in declarations.get(nom, []):
+            a_visiter |= appels(declaration[3])
+
+    return enleve_fonctions(ast, atteintes)
+
+def cherche_declarations(ast, declarations):
+    if type(ast) == tuple:
+        if ast[0] == "FONCTION":
+            declarations.setdefault(ast[1], []).append(ast)
+        for a in ast[1:]:
+            cherche_declarations(a, declarations)
+    elif type(ast) == list:
+        for a in ast:
+            cherche_declarations(a, declarations)
+
+def appels(ast):
+    """Renvoie les noms des fonctions appelées dans ast, sans compter celles appelées par les fonctions déclarées."""
+    noms = set()
+    if type(ast) == tuple:
+        if ast[0] == "FONCTION":
+            return noms
+        if ast[0] == "APPEL":
+            noms.add(ast[1])
+        for a in ast[1:]:
+            noms |= appels(a)
+    elif type(ast) == list:
+        for a in ast:
+            noms |= appels(a)
+    return noms
+
+def enleve_fonctions(ast, gardees):
+    if type(ast) == list:
+        return [enleve_fonctions(a, gardees) for a in ast
+                if not (type(a) == tuple and a[0] == "FONCTION" and a[1] not in gardees)]
+    elif type(ast) == tuple:
+        return tuple(enleve_fonctions(a, gardees) for a in ast)
+    return ast
+
+
+# Variables jamais lues
+
+def elimine_variables_inutiles(ast):
+    return enleve_affectations(ast, variables_lues(ast))
+
+def variables_lues(ast):
+    noms = set()
+    if type(ast) == tuple:
+        if ast[0] == "VARIABLE":
+            noms.add(ast[1])
+        for a in ast[1:]:
+            noms |= variables_lues(a)
+    elif type(ast) == list:
+        for a in ast:
+            noms |= variables_lues(a)
+    return noms
+
+def enleve_affectations(ast, lues):
+    # On ne peut enlever l'affectation que si le calcul de la valeur n'a pas d'effet : on garde celles qui
+    # contiennent un appel de fonction, qui pourrait afficher quelque chose.
+    if type(ast) == list:
+        return [enleve_affectations(a, lues) for a in ast
+                if not (type(a) == tuple and a[0] == "AFFECTATION" and a[1] not in lues and not appels(a[2]))]
+    elif type(ast) == tuple:
+        return tuple(enleve_affectations(a, lues) for a in ast)
+    return ast
+
+
+# Remplacement des appels de petites fonctions par leur corps (inlining)
+# Un appel coûte une vingtaine d'instructions (arguments, adresse de retour, rbp...) : pour une fonction d'une ligne,
+# c'est bien plus que le calcul lui-même ! On remplace donc l'appel par l'expression renvoyée par la fonction,
+# dans laquelle on remplace les arguments par leur valeur.
+#
+# On ne le fait que pour les fonctions dont le corps est une suite d'affectations de variables locales suivie
+# d'un RENVOYER, sans aucun appel (ni AFFICHER ni SI) : elles n'ont donc aucun effet et ne sont pas récursives.
+# Les variables locales sont elles aussi remplacées par leur valeur, sauf si elles sont utilisées plusieurs fois :
+# pour ne pas refaire le calcul, on les affecte alors juste avant l'instruction qui contient l'appel, sous un nouveau
+# nom de la forme 'fonction.variable.1' (qui ne peut pas être écrit dans un programme, donc pas de conflit possible).
+#
+# Si la fonction lit des variables qui ne sont pas les siennes (comme x dans g, dans p7.code), on ne remplace que les
+# appels faits au même niveau que la déclaration : ailleurs, x pourrait désigner une autre variable !
+
+def remplace_appels(ast, seuil=20):
+    """Remplace les appels des fonctions dont le corps fait au plus seuil noeuds."""
+    etat = {
+        "definitions": {},  # definitions["f"] : de quoi remplacer un appel à f, ou None si ce n'est pas possible
+        "seuil": seuil,
+        "portees": 0,  # compteur pour numéroter chaque corps de fonction
+        "noms": 0,  # compteur pour les nouveaux noms de variables
+    }
+    return "BLOC", remplace_instructions(ast[1], set(), 0, etat)
+
+def remplace_instructions(asts, visibles, portee, etat):
+    """visibles : noms des variables existant déjà, portee : numéro du corps de fonction en cours (0 au départ)"""
+    instructions = []
+    for ast in asts:
+        type = ast[0]
+        if type == "FONCTION":
+            nom, args, corps = ast[1], ast[2], ast[3]
+            # Pendant la compilation de son corps, f est déjà connue (récursivité) : on ne peut pas la remplacer.
+            etat["definitions"][nom] = None
+            etat["portees"] += 1
+            corps = "BLOC", remplace_instructions(corps[1], visibles | set(args), etat["portees"], etat)
+            etat["definitions"][nom] = remplacable(nom, args, corps, visibles, portee, etat["seuil"])
+            instructions.append(("FONCTION", nom, args, corps))
+            continue
+        elif type == "BLOC":
+            instructions.append(("BLOC", remplace_instructions(ast[1], visibles, portee, etat)))
+            continue
+
+        # On peut affecter de nouvelles variables avant l'instruction seulement si aucun des appels de l'instruction
+        # n'a d'effet : sinon on pourrait changer l'ordre des calculs.
+        expression = ast[2] if type == "AFFECTATION" else ast[1]
+        avant = []
+        if all(etat["definitions"].get(f) for f in appels(expression)):
+            avant_ou_rien = avant
+        else:
+            avant_ou_rien = None
+        expression = remplace_expression(expression, portee, avant_ou_rien, etat)
+        instructions += avant
+
+        if type == "AFFECTATION":
+            visibles.add(ast[1])
+            instructions.append(("AFFECTATION", ast[1], expression))
+        elif type == "CONDITION":
+            bloc = "BLOC", remplace_instructions(ast[2][1], visibles, portee, etat)
+            instructions.append(("CONDITION", expression, bloc))
+        else:
+            instructions.append((type, expression))
+    return instructions
+
+def remplacable(nom, args, corps, visibles, portee, seuil):
+    instructions = corps[1]
+    if not instructions or instructions[-1][0] != "RENVOYER":
+        return None
+
+    locales = set(args)
+    affectations = []
+    for ast in instructions[:-1]:
+        if ast[0] != "AFFECTATION" or appels(ast[2]):
+            return None
+        if ast[1] not in locales:
+            # Affecter une variable qui existait déjà modifie la variable extérieure !
+            if ast[1] in visibles:
+                return None
+            locales.add(ast[1])
+        affectations.append((ast[1], ast[2]))
+
+    retour = instructions[-1][1]
+    if appels(retour) or sum(taille(e) for _, e in affectations) + taille(retour) > seuil:
+        return None
+
+    lues = variables_lues(retour)
+    for _, e in affectations:
+        lues |= variables_lues(e)
+    return {
+        "nom": nom,
+        "args": args,
+        "affectations": affectations,
+        "retour": retour,
+        "portee": portee if lues - locales else None,  # None : on peut remplacer les appels n'importe où
+    }
+
+def remplace_expression(ast, portee, avant, etat):
+    type = ast[0]
+    if type in ("PLUS", "MOINS", "FOIS", "EGALE"):
+        return type, remplace_expression(ast[1], portee, avant, etat), remplace_expression(ast[2], portee, avant, etat)
+    elif type == "APPEL":
+        args = [remplace_expression(a, portee, avant, etat) for a in ast[2]]
+        definition = etat["definitions"].get(ast[1])
+        if definition and definition["portee"] in (None, portee) and not appels(args):
+            corps = corps_remplace(definition, args, avant, etat)
+            if corps is not None:
+                return corps
+        return "APPEL", ast[1], args
+    return ast
+
+def corps_remplace(definition, args, avant, etat):
+    """
+    Renvoie l'expression qui remplace l'appel, ou None si c'est impossible.
+    Les nouvelles affectations nécessaires sont ajoutées à la liste avant (si elle vaut None, on n'en fait aucune).
+    """
+    # Nombre d'utilisations de chaque variable de la fonction
+    utilisations = {}
+    for _, e in definition["affectations"]:
+        compte_variables(e, utilisations)
+    compte_variables(definition["retour"], utilisations)
+
+    nouvelles = []
+    valeurs = {}
+    liaisons = list(zip(definition["args"], args))
+    liaisons += [(nom, None) for nom, _ in definition["affectations"]]
+    expressions = iter(e for _, e in definition["affectations"])
+    for nom, valeur in liaisons:
+        if valeur is None:
+            valeur = substitue(next(expressions), valeurs)
+        if valeur[0] in ("ENTIER", "VARIABLE") or utilisations.get(nom, 0) <= 1:
+            valeurs[nom] = valeur
+        elif avant is None:
+            return None
+        else:
+            etat["noms"] += 1
+            nouveau = "{}.{}.{}".format(definition["nom"], nom, etat["noms"])
+            nouvelles.append(("AFFECTATION", nouveau, valeur))
+            valeurs[nom] = "VARIABLE", nouveau
+
+    if avant is not None:
+        avant += nouvelles
+    return substitue(definition["retour"], valeurs)
+
+def substitue(ast, valeurs):
+    type = ast[0]
+    if type in ("PLUS", "MOINS", "FOIS", "EGALE"):
+        return type, substitue(ast[1], valeurs), substitue(ast[2], valeurs)
+    elif type == "VARIABLE":
+        return valeurs.get(ast[1], ast)
+    return ast
+
+def compte_variables(ast, utilisations):
+    if ast[0] == "VARIABLE":
+        utilisations[ast[1]] = utilisations.get(ast[1], 0) + 1
+    elif ast[0] in ("PLUS", "MOINS", "FOIS", "EGALE"):
+        compte_variables(ast[1], utilisations)
+        compte_variables(ast[2], utilisations)
+
+def taille(ast):
+    """Nombre de noeuds d'une expression."""
+    if ast[0] in ("PLUS", "MOINS", "FOIS", "EGALE"):
+        return 1 + taille(ast[1]) + taille(ast[2])
+    return 1
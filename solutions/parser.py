@@ -59,6 +59,82 @@ import ply.lex as lex
 lex.lex()
 
 
+# Lexer rapide
+# Le lexer de PLY appelle une fonction Python pour chaque identifieur (t_IDENT) et chaque saut de ligne (t_newline),
+# et crée les tokens un par un : sur un gros fichier, c'est long. decoupe() fait la même chose d'un coup :
+# - une seule expression régulière découpe tout le texte (re.findall fait la boucle en C, pas en Python),
+# - chaque texte différent n'est classé (mot-clé, IDENT, ENTIER...) qu'une fois, puis on le retrouve dans un
+#   dictionnaire : pour un programme où la même variable apparaît mille fois, on la classe une seule fois,
+# - les numéros de ligne et les positions sont calculés avec map et itertools.accumulate, eux aussi en C.
+# Les tokens sont rangés dans des tableaux compacts (array) : un octet par token pour le type, quatre pour la ligne
+# et la position. N'importe quel parser peut les lire directement ; pour PLY, tokens_ply() les transforme un par un
+# en tokens PLY, au fur et à mesure que le parser les demande.
+# Les expressions régulières sont celles des règles t_... ci-dessus : les deux lexers reconnaissent les mêmes tokens.
+
+import re
+import array
+from itertools import accumulate, repeat, islice
+from operator import itemgetter, add, sub
+
+def regle(nom):
+    r = globals()["t_" + nom]
+    return r.__doc__ if callable(r) else r
+
+noms_regles = [nom for nom in tokens if nom not in reserves]
+# Un token, précédé des espaces et sauts de ligne à ignorer. Un caractère qui n'est le début d'aucun token est
+# gardé seul, pour pouvoir signaler l'erreur.
+blancs = "[" + re.escape(t_ignore) + "\\n]"
+expression_tokens = re.compile("({}*)({}|[^{}])".format(blancs, "|".join(regle(nom) for nom in noms_regles), blancs[1:-1]))
+# Pour classer un texte : le nom du groupe qui correspond est le type du token
+expression_types = re.compile("|".join("(?P<{}>{})".format(nom, regle(nom)) for nom in noms_regles))
+invalide = len(tokens) # type des caractères invalides
+
+def type_token(valeur):
+    m = expression_types.fullmatch(valeur)
+    if m is None:
+        return invalide
+    if m.lastgroup == "IDENT" and valeur in reserves:
+        return tokens.index(valeur)
+    return tokens.index(m.lastgroup)
+
+def decoupe(s):
+    """
+    Découpe tout le texte en tokens. Renvoie un dictionnaire de tableaux, avec une case par token :
+    - "types" : le numéro du type du token dans la liste tokens,
+    - "valeurs" : son texte,
+    - "lignes" : son numéro de ligne,
+    - "positions" : la position de son premier caractère dans le texte.
+    """
+    paires = expression_tokens.findall(s)
+    blancs_avant = list(map(itemgetter(0), paires))
+    valeurs = list(map(itemgetter(1), paires))
+    del paires
+
+    connus = {}
+    for valeur in set(valeurs):
+        connus[valeur] = type_token(valeur)
+    types = array.array('B', map(connus.__getitem__, valeurs))
+    # Ligne d'un token : 1 + le nombre de sauts de ligne avant lui
+    lignes = array.array('I', islice(accumulate(map(str.count, blancs_avant, repeat('\n')), initial=1), 1, None))
+    longueurs = list(map(len, valeurs))
+    positions = array.array('I', map(sub, accumulate(map(add, map(len, blancs_avant), longueurs)), longueurs))
+
+    if invalide in types:
+        i = types.index(invalide)
+        raise RuntimeError("Caractère invalide à la ligne {}: {}".format(lignes[i], valeurs[i][0]))
+    return {"types": types, "valeurs": valeurs, "lignes": lignes, "positions": positions}
+
+def tokens_ply(jetons):
+    """Renvoie une fonction qui donne les tokens à PLY un par un, puis None à la fin (comme lex.lexer.token)"""
+    suivants = map(token_ply, jetons["types"], jetons["valeurs"], jetons["lignes"], jetons["positions"])
+    return lambda: next(suivants, None)
+
+def token_ply(type, valeur, ligne, position):
+    t = lex.LexToken()
+    t.type, t.value, t.lineno, t.lexpos = tokens[type], valeur, ligne, position
+    return t
+
+
 # Parsing : transformation de la liste de tokens en AST
 
 # On introduit des règles récursives qui permettent de transformer petit à petit une séquence de tokens en AST.
@@ -186,27 +262,40 @@ import ply.yacc as yacc
 yacc.yacc(start='bloc', debug=False, write_tables=False) # Si vous changez le parser et avez des erreurs, remplacez ces False par True !
 
 
-def parse(s):
-    return yacc.parse(s, tracking=True)
+def parse(s, lexer_ply=False):
+    """Avec lexer_ply=True, on utilise le lexer de PLY au lieu du lexer rapide (voir decoupe())."""
+    if lexer_ply:
+        lex.lexer.lineno = 1 # Les numéros de ligne repartent de 1 pour chaque nouveau programme
+        return yacc.parse(s, tracking=True)
+    return yacc.parse(tokenfunc=tokens_ply(decoupe(s)), tracking=True)
 
 # Affiche joliment un arbre de syntaxe abstraite.
-def print_ast(ast):
-    print(print_ast_aux(ast, 0).rstrip(',\n'))
-
-def print_ast_aux(ast, indent):
-    ind = ''.join(['  '] * indent)
+# Le texte est écrit au fur et à mesure dans sortie (n'importe quel fichier, par défaut la sortie standard) : même
+# pour un très gros arbre, on ne construit jamais de grande chaîne de caractères.
+import sys
+
+def print_ast(ast, sortie=None):
+    if sortie is None:
+        sortie = sys.stdout
+    print_ast_aux(ast, 0, "", sortie)
+    sortie.write('\n')
+
+def print_ast_aux(ast, indent, debut, sortie):
+    """debut : ce qui est écrit au début de la première ligne (l'indentation, ou les parenthèses ouvrantes)"""
     if type(ast) == str:
-        return ind + "'" + ast + "'" + ",\n"
+        sortie.write(debut + "'" + ast + "'")
+        return
     if type(ast) == tuple:
         p = '(', ')'
     elif type(ast) == list:
         p = '[', ']'
-    s = ""
-    first = True
-    for a in ast:
-        t = print_ast_aux(a, indent+1)
-        if first:
-            first = False
-            t = ind + p[0] + t.lstrip(' ')
-        s += t
-    return s.rstrip(',\n') + p[1] + ',\n'
+    if len(ast) == 0:
+        sortie.write(debut + p[0])
+    for i, a in enumerate(ast):
+        if i == 0:
+            # Le premier élément est sur la même ligne que la parenthèse ouvrante
+            print_ast_aux(a, indent+1, debut + p[0], sortie)
+        else:
+            sortie.write(',\n')
+            print_ast_aux(a, indent+1, '  ' * (indent+1), sortie)
+    sortie.write(p[1])
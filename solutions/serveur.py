@@ -0,0 +1,128 @@
+"""
+Serveur de compilation : un processus qui reste lancé, avec le parser et le compilateur déjà chargés.
+Utilisation :
+python serveur.py &
+python client.py p1.code
+
+Lancer `python main.py p1.code` coûte bien plus cher que compiler p1.code : il faut démarrer Python, importer PLY,
+construire les tables du lexer et du parser... Le serveur ne fait tout cela qu'une fois, puis attend des requêtes
+sur une socket Unix (un fichier spécial, /tmp/ipt-<uid>.sock par défaut).
+
+Chaque requête est une ligne JSON : {"programme": "...", "action": "execution", "optimise": false, "registres": false}
+où l'action est "parse", "compile" ou "execution" (l'étape à laquelle on s'arrête).
+La réponse est une ligne JSON, comme celles de main.py : {"sortie": "...", "erreur": null, "temps": {...}},
+avec en plus "ast" ou "asm" si l'on s'arrête avant l'exécution.
+
+compile.py range tout son état dans des variables globales : deux compilations en même temps dans le même processus
+se mélangeraient. Le serveur crée donc un processus fils (fork) pour chaque connexion. Le fils a sa propre copie de
+tout, déjà chargée : plusieurs clients peuvent être servis en même temps sans se gêner, et un programme qui plante
+(ou qui modifie l'état du compilateur) ne touche pas au serveur.
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import stat
+import sys
+
+import parser, compile, interprete_asm
+import main
+from client import SOCKET_PAR_DEFAUT
+
+
+DELAI = 60  # secondes sans pouvoir lire ni écrire sur une connexion avant de l'abandonner
+
+
+def traite_requete(requete):
+    if not isinstance(requete, dict):
+        return {"sortie": "", "erreur": "Requête invalide : un objet JSON est attendu", "temps": {}}
+    if "programme" not in requete:
+        return {"sortie": "", "erreur": "Requête sans programme", "temps": {}}
+    action = requete.get("action", "execution")
+    if action not in ("parse", "compile", "execution"):
+        return {"sortie": "", "erreur": "Action inconnue : {}".format(action), "temps": {}}
+    return main.execute_programme(requete["programme"], requete.get("optimise", False),
+                                  requete.get("registres", False), action)
+
+def traite_connexion(connexion):
+    """
+    Répond à chaque ligne reçue, jusqu'à ce que le client ferme la connexion, ou qu'il ne lise ni n'écrive plus
+    rien pendant DELAI secondes (un client bloqué ne doit pas garder un processus fils pour toujours).
+    """
+    connexion.settimeout(DELAI)
+    try:
+        reponds(connexion)
+    except OSError:
+        pass # Délai dépassé, ou client parti : rien à lui répondre
+
+def reponds(connexion):
+    # Deux fichiers séparés pour lire et écrire : un seul fichier 'rw' perdrait ce qu'il a déjà lu en avance.
+    with connexion.makefile('r', encoding='utf-8') as lecture, connexion.makefile('w', encoding='utf-8') as ecriture:
+        for ligne in lecture:
+            try:
+                reponse = traite_requete(json.loads(ligne))
+            except ValueError as e:
+                reponse = {"sortie": "", "erreur": "Requête invalide : {}".format(e), "temps": {}}
+            ecriture.write(json.dumps(reponse, ensure_ascii=False) + '\n')
+            ecriture.flush()
+
+def libere_socket(chemin_socket):
+    """
+    Supprime la socket laissée par un serveur qui s'est mal arrêté. Si un serveur y répond encore, ou si le chemin
+    n'est pas une socket, on ne touche à rien : lève une RuntimeError.
+    """
+    if not os.path.exists(chemin_socket):
+        return
+    if not stat.S_ISSOCK(os.stat(chemin_socket).st_mode):
+        raise RuntimeError("{} existe déjà et n'est pas une socket".format(chemin_socket))
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as essai:
+        try:
+            essai.connect(chemin_socket)
+        except ConnectionRefusedError:
+            os.remove(chemin_socket)  # personne n'écoute plus
+            return
+    raise RuntimeError("Un serveur écoute déjà sur {}".format(chemin_socket))
+
+def sert(chemin_socket=SOCKET_PAR_DEFAUT):
+    libere_socket(chemin_socket)
+    serveur = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    serveur.bind(chemin_socket)
+    serveur.listen()
+    # Les fils terminés disparaissent d'eux-mêmes (sinon il faudrait attendre chacun avec os.wait())
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    # kill arrête le serveur proprement (en supprimant la socket)
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+
+    try:
+        while True:
+            connexion, _ = serveur.accept()
+            if os.fork() == 0:
+                # Processus fils : il s'occupe de cette connexion, puis s'arrête.
+                serveur.close()
+                try:
+                    traite_connexion(connexion)
+                finally:
+                    os._exit(0)
+            connexion.close()
+    finally:
+        serveur.close()
+        os.remove(chemin_socket)
+
+
+def main_serveur(arguments=None):
+    options = argparse.ArgumentParser(description="Serveur de compilation, à utiliser avec client.py.")
+    options.add_argument('--socket', default=SOCKET_PAR_DEFAUT, help="chemin de la socket")
+    options = options.parse_args(arguments)
+    try:
+        sert(options.socket)
+    except KeyboardInterrupt:
+        pass
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main_serveur())
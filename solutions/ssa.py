@@ -0,0 +1,715 @@
+"""
+Compilation en passant par une représentation intermédiaire (IR) à trois adresses, sous forme SSA.
+
+Utilisation :
+>>> import parser, ssa
+>>> ir = ssa.construit(parser.parse(code))
+>>> statistiques = ssa.optimise(ir)   # ou ssa.optimise(ir, passes_actives=["cse"]) pour n'en lancer que certaines
+>>> ssa.print_ir(ir)
+>>> asm = ssa.genere(ir)
+ou directement :
+>>> asm = ssa.compile(ast)
+
+L'AST est un arbre : pratique pour compiler, mais pas pour savoir quelles valeurs sont déjà calculées ou
+quelles affectations ne servent à rien. Dans l'IR, chaque instruction fait une seule opération, et range son
+résultat dans une nouvelle variable temporaire '%12' qui n'est affectée qu'une fois (c'est la forme SSA,
+pour Static Single Assignment) : une même temporaire a donc toujours la même valeur, ce qui simplifie beaucoup
+les optimisations.
+
+Le code d'une fonction est découpé en blocs : des suites d'instructions sans saut, terminées par une instruction
+qui dit où aller ensuite. Quand deux chemins se rejoignent (après un SI), une variable peut valoir deux valeurs
+différentes : l'instruction phi choisit la bonne selon le bloc d'où l'on vient.
+
+Instructions (t, a, b sont des temporaires) :
+("const",   t, n)            t <- n
+("copie",   t, a)            t <- a
+("add",     t, a, b)         t <- a + b  (de même pour "sub" et "mul")
+("phi",     t, [(bloc, a)])  t <- a, si l'on vient de bloc
+("param",   t, i)            t <- i-ème argument de la fonction
+("lit",     t, "x")          t <- variable globale x (en mémoire)
+("ecrit",   "x", a)          variable globale x <- a
+("affiche", a)
+("appel",   t, "f", [a, b])  t <- f(a, b)
+Fins de blocs :
+("saut",    bloc)
+("si_nul",  a, bloc1, bloc2) va dans bloc1 si a vaut 0 (convention du SI, voir compile_condition()), bloc2 sinon
+("renvoie", a)
+("fin",)                     fin du programme
+
+Les variables locales (et les variables globales que les fonctions n'utilisent pas) sont directement des
+temporaires. Les variables globales utilisées par les fonctions restent en mémoire, puisqu'un appel peut les
+modifier. Les fonctions qui lisent les variables d'une fonction englobante (comme g dans p7.code) ne sont pas gérées.
+"""
+
+import time
+
+
+# Construction de l'IR à partir de l'AST
+
+noms_reserves = ("principal", "fin")  # étiquettes du programme principal et de sa fin (voir genere())
+
+def construit(ast):
+    etat = {
+        "temporaires": 0,
+        "fonctions": [],
+        "noms": {},  # noms["f"] contient le nom dans l'IR de la fonction f actuellement déclarée
+        "partagees": set(),  # variables globales gardées en mémoire
+        "globales": set(),  # variables globales déjà affectées
+    }
+    noms_dans_les_fonctions(ast, etat["partagees"])
+
+    # Le programme principal n'est pas une fonction déclarée : il garde son nom réservé.
+    principal = {"nom": "principal", "args": [], "blocs": []}
+    nouveau_bloc(principal)
+    contexte = nouveau_contexte(principal, etat, None)
+    for instr in ast[1]:
+        instruction(instr, contexte)
+    if contexte["bloc"] is not None:
+        contexte["bloc"]["fin"] = ("fin",)
+
+    return {
+        "fonctions": etat["fonctions"],
+        "principal": principal,
+        "globales": sorted(etat["partagees"] & etat["globales"]),
+    }
+
+def noms_dans_les_fonctions(ast, noms, dans_une_fonction=False):
+    """Noms de toutes les variables lues ou affectées dans le corps d'une fonction."""
+    if type(ast) == tuple:
+        if ast[0] == "FONCTION":
+            dans_une_fonction = True
+        elif dans_une_fonction and ast[0] in ("VARIABLE", "AFFECTATION"):
+            noms.add(ast[1])
+        for a in ast[1:]:
+            noms_dans_les_fonctions(a, noms, dans_une_fonction)
+    elif type(ast) == list:
+        for a in ast:
+            noms_dans_les_fonctions(a, noms, dans_une_fonction)
+
+def nouvelle_fonction(nom, etat):
+    nom_ir = nom
+    numero = 1
+    while any(f["nom"] == nom_ir for f in etat["fonctions"]) or nom_ir in noms_reserves:
+        numero += 1
+        nom_ir = "{}.{}".format(nom, numero)
+    fonction = {"nom": nom_ir, "args": [], "blocs": []}
+    etat["fonctions"].append(fonction)
+    nouveau_bloc(fonction)
+    return fonction
+
+def nouveau_bloc(fonction):
+    bloc = {"nom": "{}:{}".format(fonction["nom"], len(fonction["blocs"])), "instrs": [], "fin": None}
+    fonction["blocs"].append(bloc)
+    return bloc
+
+def nouveau_contexte(fonction, etat, englobant):
+    return {
+        "fonction": fonction,
+        "bloc": fonction["blocs"][0],  # bloc en cours (None après un RENVOYER)
+        "env": {},  # env["x"] contient la temporaire qui contient la valeur actuelle de x
+        "etat": etat,
+        "principal": englobant is None,
+        # Variables globales visibles, et variables des fonctions englobantes (que l'on ne sait pas lire)
+        "globales": set(etat["globales"]),
+        "englobantes": set() if englobant is None else englobant["englobantes"] | set(englobant["env"]),
+        "declarees": set(),  # variables affectées seulement après un RENVOYER (voir declare())
+    }
+
+def temporaire(contexte):
+    contexte["etat"]["temporaires"] += 1
+    return "%{}".format(contexte["etat"]["temporaires"])
+
+def emet(contexte, instr):
+    contexte["bloc"]["instrs"].append(instr)
+
+def instruction(ast, contexte):
+    if contexte["bloc"] is None:
+        declare(ast, contexte) # Après un RENVOYER, rien n'est exécuté
+        return
+
+    type = ast[0]
+    if type == "AFFICHER":
+        emet(contexte, ("affiche", expression(ast[1], contexte)))
+    elif type == "AFFECTATION":
+        affecte(ast[1], expression(ast[2], contexte), contexte)
+    elif type == "BLOC":
+        for a in ast[1]:
+            instruction(a, contexte)
+    elif type == "CONDITION":
+        condition(ast[1], ast[2], contexte)
+    elif type == "FONCTION":
+        declaration(ast[1], ast[2], ast[3], contexte)
+    elif type == "RENVOYER":
+        if contexte["principal"]:
+            raise RuntimeError("RENVOYER en dehors d'une fonction")
+        contexte["bloc"]["fin"] = ("renvoie", expression(ast[1], contexte))
+        contexte["bloc"] = None
+
+def expression(ast, contexte):
+    type = ast[0]
+    if type == "ENTIER":
+        t = temporaire(contexte)
+        emet(contexte, ("const", t, int(ast[1])))
+    elif type in ("PLUS", "MOINS", "FOIS", "EGALE"):
+        a = expression(ast[1], contexte)
+        b = expression(ast[2], contexte)
+        t = temporaire(contexte)
+        # EGALE vaut a - b, comme dans compile_egale()
+        op = {"PLUS": "add", "MOINS": "sub", "FOIS": "mul", "EGALE": "sub"}[type]
+        emet(contexte, (op, t, a, b))
+    elif type == "VARIABLE":
+        t = lit(ast[1], contexte)
+    elif type == "APPEL":
+        args = [expression(a, contexte) for a in ast[2]]
+        if ast[1] not in contexte["etat"]["noms"]:
+            raise RuntimeError("Fonction inconnue : {}".format(ast[1]))
+        t = temporaire(contexte)
+        emet(contexte, ("appel", t, contexte["etat"]["noms"][ast[1]], args))
+    return t
+
+def en_memoire(nom, contexte):
+    return nom not in contexte["env"] and nom in contexte["etat"]["partagees"] \
+        and (contexte["principal"] or nom in contexte["globales"])
+
+def lit(nom, contexte):
+    if en_memoire(nom, contexte):
+        t = temporaire(contexte)
+        emet(contexte, ("lit", t, nom))
+        return t
+    if nom in contexte["env"]:
+        return contexte["env"][nom]
+    if nom in contexte["englobantes"]:
+        raise RuntimeError("Variable d'une fonction englobante non gérée : {}".format(nom))
+    raise RuntimeError("Variable inconnue : {}".format(nom))
+
+def affecte(nom, valeur, contexte):
+    if contexte["principal"]:
+        contexte["etat"]["globales"].add(nom)
+    if en_memoire(nom, contexte):
+        emet(contexte, ("ecrit", nom, valeur))
+    elif nom in contexte["englobantes"] and nom not in contexte["env"]:
+        raise RuntimeError("Variable d'une fonction englobante non gérée : {}".format(nom))
+    else:
+        contexte["env"][nom] = valeur
+
+def declare(ast, contexte):
+    """
+    Ce qu'il reste d'une instruction qui n'est jamais exécutée (comme optimisations.declarations()) : les fonctions
+    qu'elle déclare, et les variables qu'elle crée, qui existent quand même (voir condition()).
+    """
+    type = ast[0]
+    if type == "AFFECTATION":
+        if ast[1] not in contexte["env"] and ast[1] not in contexte["englobantes"] and not en_memoire(ast[1], contexte):
+            contexte["declarees"].add(ast[1])
+    elif type == "BLOC":
+        for a in ast[1]:
+            declare(a, contexte)
+    elif type == "CONDITION":
+        declare(ast[2], contexte)
+    elif type == "FONCTION":
+        declaration(ast[1], ast[2], ast[3], contexte)
+
+def condition(test, alors, contexte):
+    t = expression(test, contexte)
+    fonction = contexte["fonction"]
+    bloc_test = contexte["bloc"]
+    env_avant = dict(contexte["env"])
+
+    bloc_alors = nouveau_bloc(fonction)
+    contexte["bloc"] = bloc_alors
+    instruction(alors, contexte)
+    fin_alors = contexte["bloc"]
+    env_alors = contexte["env"]
+
+    bloc_suite = nouveau_bloc(fonction)
+    bloc_test["fin"] = ("si_nul", t, bloc_alors["nom"], bloc_suite["nom"])
+    contexte["bloc"] = bloc_suite
+    contexte["env"] = env_avant
+    if fin_alors is None:
+        # Le ALORS s'est terminé par un RENVOYER : on ne peut arriver ici que sans passer par lui. Les variables
+        # qu'il crée existent quand même, et valent 0 (comme une case mémoire jamais écrite).
+        for nom in sorted((set(env_alors) | contexte["declarees"]) - set(env_avant)):
+            env_avant[nom] = temporaire(contexte)
+            bloc_test["instrs"].append(("const", env_avant[nom], 0))
+        contexte["declarees"] = set()
+        return
+    fin_alors["fin"] = ("saut", bloc_suite["nom"])
+
+    # Les variables modifiées dans le ALORS ont deux valeurs possibles.
+    for nom, valeur in env_alors.items():
+        if env_avant.get(nom) != valeur:
+            if nom not in env_avant:
+                # Variable créée dans le ALORS : elle vaut 0 sinon (comme une case mémoire jamais écrite).
+                env_avant[nom] = temporaire(contexte)
+                bloc_test["instrs"].append(("const", env_avant[nom], 0))
+            phi = temporaire(contexte)
+            emet(contexte, ("phi", phi, [(bloc_test["nom"], env_avant[nom]), (fin_alors["nom"], valeur)]))
+            contexte["env"][nom] = phi
+
+def declaration(nom, args, corps, contexte):
+    etat = contexte["etat"]
+    fonction = nouvelle_fonction(nom, etat)
+    etat["noms"][nom] = fonction["nom"]  # avant le corps, en cas de récursivité
+
+    interieur = nouveau_contexte(fonction, etat, None if contexte["principal"] else contexte)
+    interieur["principal"] = False
+    for i, arg in enumerate(args):
+        t = temporaire(interieur)
+        emet(interieur, ("param", t, i))
+        fonction["args"].append(t)
+        interieur["env"][arg] = t
+    # Les fonctions déclarées dans le corps n'en masquent d'autres que dans ce corps.
+    noms_avant = dict(etat["noms"])
+    instruction(corps, interieur)
+    etat["noms"] = noms_avant
+    if interieur["bloc"] is not None:
+        # On a oublié le RENVOYER : on renvoie 0 plutôt que d'exécuter la suite du code.
+        t = temporaire(interieur)
+        emet(interieur, ("const", t, 0))
+        interieur["bloc"]["fin"] = ("renvoie", t)
+
+
+# Affichage
+
+def print_ir(ir):
+    for fonction in ir["fonctions"] + [ir["principal"]]:
+        print("{}({}) :".format(fonction["nom"], ", ".join(fonction["args"])))
+        for bloc in fonction["blocs"]:
+            print("  {}".format(bloc["nom"]))
+            for instr in bloc["instrs"] + [bloc["fin"]]:
+                print("    " + " ".join(str(o) for o in instr))
+
+
+# Outils pour les optimisations
+
+def operandes(instr):
+    """Temporaires lues par une instruction."""
+    op = instr[0]
+    if op in ("copie", "ecrit"):
+        return [instr[2]]
+    elif op in ("add", "sub", "mul"):
+        return [instr[2], instr[3]]
+    elif op == "phi":
+        return [a for _, a in instr[2]]
+    elif op in ("affiche", "si_nul", "renvoie"):
+        return [instr[1]]
+    elif op == "appel":
+        return list(instr[3])
+    return []
+
+def renomme(instr, noms):
+    """Remplace dans une instruction chaque temporaire lue t par noms[t] (si elle y est)."""
+    op = instr[0]
+    r = lambda t: noms.get(t, t)
+    if op in ("copie", "ecrit"):
+        return op, instr[1], r(instr[2])
+    elif op in ("add", "sub", "mul"):
+        return op, instr[1], r(instr[2]), r(instr[3])
+    elif op == "phi":
+        return op, instr[1], [(b, r(a)) for b, a in instr[2]]
+    elif op in ("affiche", "renvoie"):
+        return op, r(instr[1])
+    elif op == "si_nul":
+        return op, r(instr[1]), instr[2], instr[3]
+    elif op == "appel":
+        return op, instr[1], instr[2], [r(a) for a in instr[3]]
+    return instr
+
+def resultat(instr):
+    """Temporaire affectée par une instruction, ou None."""
+    if instr[0] in ("const", "copie", "add", "sub", "mul", "phi", "param", "lit", "appel"):
+        return instr[1]
+    return None
+
+def successeurs(bloc):
+    fin = bloc["fin"]
+    if fin[0] == "saut":
+        return [fin[1]]
+    elif fin[0] == "si_nul":
+        return [fin[2], fin[3]]
+    return []
+
+def toutes_les_fonctions(ir):
+    return ir["fonctions"] + [ir["principal"]]
+
+def taille(ir):
+    """Nombre d'instructions de l'IR."""
+    return sum(len(bloc["instrs"]) + 1 for f in toutes_les_fonctions(ir) for bloc in f["blocs"])
+
+
+# Passe 1 : élimination des sous-expressions communes (CSE, pour Common Subexpression Elimination)
+# Si a * a a déjà été calculé dans une temporaire t, on la réutilise au lieu de refaire le calcul.
+# C'est possible si le premier calcul a forcément été fait avant : il doit être dans le même bloc, ou dans un bloc
+# par lequel on passe forcément (on dit qu'il domine le bloc en cours).
+# Pour les lectures de variables globales, on reste dans le même bloc, et on oublie tout après un appel,
+# qui a pu les modifier.
+
+def elimine_sous_expressions(ir):
+    for fonction in toutes_les_fonctions(ir):
+        blocs = {bloc["nom"]: bloc for bloc in fonction["blocs"]}
+        enfants = arbre_dominateurs(fonction)
+        cse_bloc(fonction["blocs"][0], {}, {}, blocs, enfants)
+
+def arbre_dominateurs(fonction):
+    """Renvoie, pour chaque bloc, les blocs qu'il domine directement."""
+    noms = [bloc["nom"] for bloc in fonction["blocs"]]
+    predecesseurs = {nom: [] for nom in noms}
+    for bloc in fonction["blocs"]:
+        for s in successeurs(bloc):
+            predecesseurs[s].append(bloc["nom"])
+
+    # Il n'y a pas de boucle, et chaque bloc est créé après ses prédécesseurs : un seul passage suffit.
+    dominateurs = {}
+    for nom in noms:
+        preds = [dominateurs[p] for p in predecesseurs[nom] if p in dominateurs]
+        dominateurs[nom] = (set.intersection(*preds) if preds else set()) | {nom}
+
+    enfants = {nom: [] for nom in noms}
+    for nom in noms:
+        stricts = dominateurs[nom] - {nom}
+        if stricts:
+            # Le dominateur immédiat est celui qui a le plus de dominateurs.
+            parent = max(stricts, key=lambda d: len(dominateurs[d]))
+            enfants[parent].append(nom)
+    return enfants
+
+def cse_bloc(bloc, disponibles, remplacees, blocs, enfants):
+    """
+    disponibles[("mul", "%1", "%1")] contient une temporaire qui vaut déjà %1 * %1,
+    remplacees["%3"] contient la temporaire qui a la même valeur que %3 (pour que %3 * %3 soit reconnu aussi).
+    """
+    disponibles = dict(disponibles)
+    remplacees = dict(remplacees)
+    memoire = {}  # memoire["x"] contient une temporaire qui a la valeur de la variable globale x
+    instrs = []
+    for instr in bloc["instrs"]:
+        instr = renomme(instr, remplacees)
+        op = instr[0]
+        cle = None
+        if op == "const":
+            cle = op, instr[2]
+        elif op in ("add", "mul"):
+            cle = (op,) + tuple(sorted(instr[2:]))
+        elif op == "sub":
+            cle = instr[0], instr[2], instr[3]
+
+        if cle is not None:
+            if cle in disponibles:
+                remplacees[instr[1]] = disponibles[cle]
+                instr = "copie", instr[1], disponibles[cle]
+            else:
+                disponibles[cle] = instr[1]
+        elif op == "lit":
+            if instr[2] in memoire:
+                remplacees[instr[1]] = memoire[instr[2]]
+                instr = "copie", instr[1], memoire[instr[2]]
+            else:
+                memoire[instr[2]] = instr[1]
+        elif op == "ecrit":
+            memoire[instr[1]] = instr[2]
+        elif op == "appel":
+            memoire = {}
+        instrs.append(instr)
+    bloc["instrs"] = instrs
+    bloc["fin"] = renomme(bloc["fin"], remplacees)
+
+    for enfant in enfants[bloc["nom"]]:
+        cse_bloc(blocs[enfant], disponibles, remplacees, blocs, enfants)
+
+
+# Passe 2 : propagation des copies
+# Après t <- a, on peut utiliser a partout à la place de t, et supprimer la copie.
+# Un phi dont toutes les valeurs sont les mêmes est aussi une copie.
+
+def propage_copies(ir):
+    for fonction in toutes_les_fonctions(ir):
+        while True:
+            copies = {}
+            for bloc in fonction["blocs"]:
+                for instr in bloc["instrs"]:
+                    if instr[0] == "copie":
+                        copies[instr[1]] = instr[2]
+                    elif instr[0] == "phi" and len({a for _, a in instr[2]}) == 1:
+                        copies[instr[1]] = instr[2][0][1]
+            if not copies:
+                break
+            # On suit les chaînes de copies : t1 <- t2, t2 <- t3 donne t1 <- t3.
+            for t in copies:
+                while copies[t] in copies:
+                    copies[t] = copies[copies[t]]
+            for bloc in fonction["blocs"]:
+                bloc["instrs"] = [renomme(instr, copies) for instr in bloc["instrs"] if resultat(instr) not in copies]
+                bloc["fin"] = renomme(bloc["fin"], copies)
+
+
+# Passe 3 : élimination des écritures mortes
+# - une écriture dans une variable globale est inutile si la variable n'est pas relue avant d'être réécrite
+#   (ou avant la fin du programme) ; un appel ou un retour peut la relire, elle est donc vivante à ce moment-là ;
+# - une instruction sans effet dont le résultat n'est jamais utilisé est inutile.
+
+def elimine_ecritures_mortes(ir):
+    for fonction in toutes_les_fonctions(ir):
+        ecritures_globales_mortes(fonction, set(ir["globales"]))
+        temporaires_mortes(fonction)
+
+def ecritures_globales_mortes(fonction, globales):
+    vivantes_au_debut = {}
+    # Les blocs sont créés après leurs prédécesseurs : on les parcourt à l'envers.
+    for bloc in reversed(fonction["blocs"]):
+        if bloc["fin"][0] == "renvoie":
+            vivantes = set(globales)
+        else:
+            vivantes = set()
+            for s in successeurs(bloc):
+                vivantes |= vivantes_au_debut[s]
+
+        instrs = []
+        for instr in reversed(bloc["instrs"]):
+            if instr[0] == "ecrit":
+                if instr[1] not in vivantes:
+                    continue
+                vivantes.discard(instr[1])
+            elif instr[0] == "lit":
+                vivantes.add(instr[2])
+            elif instr[0] == "appel":
+                vivantes = set(globales)
+            instrs.append(instr)
+        bloc["instrs"] = instrs[::-1]
+        vivantes_au_debut[bloc["nom"]] = vivantes
+
+def temporaires_mortes(fonction):
+    sans_effet = ("const", "copie", "add", "sub", "mul", "phi", "lit")
+    while True:
+        utilisees = set()
+        for bloc in fonction["blocs"]:
+            for instr in bloc["instrs"] + [bloc["fin"]]:
+                utilisees.update(operandes(instr))
+        change = False
+        for bloc in fonction["blocs"]:
+            instrs = [i for i in bloc["instrs"] if i[0] not in sans_effet or i[1] in utilisees]
+            change = change or len(instrs) != len(bloc["instrs"])
+            bloc["instrs"] = instrs
+        if not change:
+            break
+
+
+# Gestionnaire de passes
+
+passes = [
+    ("cse", elimine_sous_expressions),
+    ("copies", propage_copies),
+    ("ecritures_mortes", elimine_ecritures_mortes),
+]
+
+def optimise(ir, passes_actives=None):
+    """
+    Lance les passes dans l'ordre (toutes, ou seulement celles dont le nom est dans passes_actives).
+    Renvoie pour chaque passe lancée le temps qu'elle a pris (en secondes) et le nombre d'instructions de l'IR
+    qu'elle a enlevées (la CSE ne fait que remplacer des calculs par des copies : c'est la passe suivante qui les
+    enlève).
+    """
+    statistiques = {}
+    for nom, passe in passes:
+        if passes_actives is not None and nom not in passes_actives:
+            continue
+        avant = taille(ir)
+        debut = time.perf_counter()
+        passe(ir)
+        statistiques[nom] = {"temps": time.perf_counter() - debut, "instructions": avant - taille(ir)}
+    return statistiques
+
+
+# Génération du code assembleur (pour interprete_asm.py)
+# Chaque temporaire a sa case en mémoire : les variables globales en mémoire sont tout en bas, puis les temporaires
+# du programme principal. Deux temporaires qui ne sont jamais utiles en même temps partagent la même case.
+# Pour une fonction, elles sont après rbp (et les arguments sont déjà sur la pile, avant l'adresse de retour et
+# l'ancien rbp, comme dans compile_fonction()).
+# Pour un calcul, on charge les opérandes dans rax et rbx, et on range le résultat dans sa case ; rcx sert à
+# calculer les adresses.
+#
+# Comme on ne connaît les adresses des blocs qu'à la fin, on produit d'abord une liste où certaines lignes sont :
+# - ("etiquette", nom)                  : ne produit pas d'instruction, donne son adresse au nom
+# - ("adresse", "rip <- const {}", nom) : le {} est remplacé par l'adresse de nom, moins 1 (pour les sauts)
+# - ("ici", "rax <- const {}")          : le {} est remplacé par l'adresse de cette ligne
+# - ("relatif", "rbx <- const {}", nom) : le {} est remplacé par ce qu'il faut ajouter à rip sur la ligne suivante
+#                                         (un addinz) pour arriver à nom
+
+def genere(ir):
+    globales = {nom: ("absolue", i) for i, nom in enumerate(ir["globales"])}
+
+    # Cases du programme principal
+    cases = dict(globales)
+    numeros = alloue_cases(ir["principal"])
+    for t, i in numeros.items():
+        cases[t] = "absolue", len(globales) + i
+    nb_cases = len(globales) + len(set(numeros.values()))
+
+    lignes = ["rax <- const {}".format(nb_cases), "rsp <- add rax", ("adresse", "rip <- const {}", "principal")]
+    for fonction in ir["fonctions"]:
+        lignes += genere_fonction(fonction, globales)
+    lignes += genere_fonction(ir["principal"], cases)
+    lignes.append(("etiquette", "fin"))
+    return resout_etiquettes(lignes)
+
+def alloue_cases(fonction):
+    """
+    Associe à chaque temporaire (sauf les arguments) un numéro de case.
+    Les blocs sont rangés dans l'ordre d'exécution possible (on ne revient jamais en arrière) : une temporaire est
+    utile de sa première affectation à sa dernière lecture, dans l'ordre où le code est écrit. On parcourt les
+    temporaires dans l'ordre de leur affectation, en réutilisant les cases qui ne servent plus.
+    """
+    copies = copies_des_phi(fonction)
+    debut, fin = {}, {}
+    position = 0
+    for bloc in fonction["blocs"]:
+        instrs = [i for i in bloc["instrs"] if i[0] not in ("phi", "param")]
+        instrs += [("copie", t, a) for t, a in copies[bloc["nom"]]] + [bloc["fin"]]
+        for instr in instrs:
+            position += 1
+            for a in operandes(instr):
+                fin[a] = position
+            t = resultat(instr)
+            if t is not None and t not in debut:
+                debut[t] = position
+
+    numeros = {}
+    occupees = []  # (fin, numéro) des cases occupées
+    libres = []
+    nb_cases = 0
+    for t in sorted(debut, key=debut.get):
+        for case in [c for c in occupees if c[0] < debut[t]]:
+            occupees.remove(case)
+            libres.append(case[1])
+        if libres:
+            numeros[t] = libres.pop()
+        else:
+            numeros[t] = nb_cases
+            nb_cases += 1
+        occupees.append((fin.get(t, debut[t]), numeros[t]))
+    return numeros
+
+def copies_des_phi(fonction):
+    """Les phi deviennent des copies à la fin des blocs précédents."""
+    copies = {bloc["nom"]: [] for bloc in fonction["blocs"]}
+    for bloc in fonction["blocs"]:
+        for instr in bloc["instrs"]:
+            if instr[0] == "phi":
+                for origine, a in instr[2]:
+                    copies[origine].append((instr[1], a))
+    return copies
+
+def genere_fonction(fonction, cases):
+    lignes = [("etiquette", fonction["nom"])]
+    principal = fonction["nom"] == "principal"
+    if not principal:
+        cases = dict(cases)
+        n = len(fonction["args"])
+        for i, t in enumerate(fonction["args"]):
+            cases[t] = "relative", -2 - n + i
+        numeros = alloue_cases(fonction)
+        for t, i in numeros.items():
+            cases[t] = "relative", i
+        nb_cases = len(set(numeros.values()))
+        lignes += empile("rbp") + ["rbp <- copy rsp", "rax <- const {}".format(nb_cases), "rsp <- add rax"]
+
+    copies = copies_des_phi(fonction)
+
+    for i, bloc in enumerate(fonction["blocs"]):
+        suivant = fonction["blocs"][i + 1]["nom"] if i + 1 < len(fonction["blocs"]) else None
+        lignes.append(("etiquette", bloc["nom"]))
+        for instr in bloc["instrs"]:
+            lignes += genere_instr(instr, cases)
+        for t, a in copies[bloc["nom"]]:
+            lignes += charge("rax", a, cases) + range_("rax", t, cases)
+        lignes += genere_fin(bloc["fin"], cases, suivant)
+    return lignes
+
+def charge(reg, t, cases):
+    return adresse_dans_rcx(cases[t]) + ["{} <- load (rcx)".format(reg)]
+
+def range_(reg, t, cases):
+    return adresse_dans_rcx(cases[t]) + ["(rcx) <- store {}".format(reg)]
+
+def adresse_dans_rcx(case):
+    type, adr = case
+    lignes = ["rcx <- const {}".format(adr)]
+    if type == "relative":
+        lignes.append("rcx <- add rbp")
+    return lignes
+
+def empile(reg):
+    return ["(rsp) <- store {}".format(reg), "rcx <- const 1", "rsp <- add rcx"]
+
+def depile(reg):
+    return ["rcx <- const 1", "rsp <- sub rcx", "{} <- load (rsp)".format(reg)]
+
+def genere_instr(instr, cases):
+    op = instr[0]
+    if op == "const":
+        return ["rax <- const {}".format(instr[2])] + range_("rax", instr[1], cases)
+    elif op == "copie":
+        return charge("rax", instr[2], cases) + range_("rax", instr[1], cases)
+    elif op in ("add", "sub", "mul"):
+        return charge("rax", instr[2], cases) + charge("rbx", instr[3], cases) \
+            + ["rax <- {} rbx".format(op)] + range_("rax", instr[1], cases)
+    elif op == "lit":
+        return adresse_dans_rcx(cases[instr[2]]) + ["rax <- load (rcx)"] + range_("rax", instr[1], cases)
+    elif op == "ecrit":
+        return charge("rax", instr[2], cases) + adresse_dans_rcx(cases[instr[1]]) + ["(rcx) <- store rax"]
+    elif op == "affiche":
+        return charge("rax", instr[1], cases) + ["print rax"]
+    elif op == "appel":
+        lignes = []
+        for a in instr[3]:
+            lignes += charge("rax", a, cases) + empile("rax")
+        # L'adresse de retour est celle du saut, 4 lignes plus loin
+        lignes += [("ici", "rax <- const {}", 4)] + empile("rax") + [("adresse", "rip <- const {}", instr[2])]
+        if instr[3]:
+            lignes += ["rbx <- const {}".format(len(instr[3])), "rsp <- sub rbx"]
+        return lignes + range_("rax", instr[1], cases)
+    return [] # phi (voir genere_fonction()) et param (déjà à leur place)
+
+def genere_fin(fin, cases, suivant):
+    if fin[0] == "saut":
+        return [] if fin[1] == suivant else [("adresse", "rip <- const {}", fin[1])]
+    elif fin[0] == "si_nul":
+        lignes = charge("rax", fin[1], cases) + [("relatif", "rbx <- const {}", fin[3]), "rax <- addinz rbx"]
+        if fin[2] != suivant:
+            lignes.append(("adresse", "rip <- const {}", fin[2]))
+        return lignes
+    elif fin[0] == "renvoie":
+        return charge("rax", fin[1], cases) + ["rsp <- copy rbp"] + depile("rbp") + depile("rip")
+    elif fin[0] == "fin":
+        return [("adresse", "rip <- const {}", "fin")]
+
+def resout_etiquettes(lignes):
+    adresses = {}
+    adresse = 0
+    for ligne in lignes:
+        if type(ligne) == tuple and ligne[0] == "etiquette":
+            adresses[ligne[1]] = adresse
+        else:
+            adresse += 1
+
+    code = ""
+    adresse = 0
+    for ligne in lignes:
+        if type(ligne) == tuple:
+            if ligne[0] == "etiquette":
+                continue
+            elif ligne[0] == "adresse":
+                ligne = ligne[1].format(adresses[ligne[2]] - 1)
+            elif ligne[0] == "ici":
+                ligne = ligne[1].format(adresse + ligne[2])
+            elif ligne[0] == "relatif":
+                ligne = ligne[1].format(adresses[ligne[2]] - adresse - 2)
+        code += ligne + "\n"
+        adresse += 1
+    return code
+
+
+def compile(ast, passes_actives=None):
+    """Compile un AST en passant par l'IR (avec toutes les passes, ou seulement celles de passes_actives)."""
+    ir = construit(ast)
+    optimise(ir, passes_actives)
+    return genere(ir)
@@ -0,0 +1,115 @@
+"""
+Tests de non-régression, à lancer avec pytest depuis ce dossier :
+python -m pytest -q
+"""
+
+import contextlib
+import io
+import socket
+
+import pytest
+
+import evalue, interprete_asm, jit, main, objet, parser, serveur, ssa
+
+
+def sortie_de(fonction, *args, **kwargs):
+    """Ce qu'affiche fonction(*args, **kwargs)."""
+    sortie = io.StringIO()
+    with contextlib.redirect_stdout(sortie):
+        fonction(*args, **kwargs)
+    return sortie.getvalue()
+
+
+# jit.py
+
+def test_jit_garde_memoire_en_debut_de_trace():
+    # La trace commence par le store, dont la garde finit par échouer : il faut l'erreur, pas une boucle infinie.
+    asm = "rbx <- const 1\n(rax) <- store rax\nrax <- add rbx\nrip <- const 0\n"
+    with pytest.raises(RuntimeError, match="en dehors de la mémoire"):
+        interprete_asm.interprete(asm)
+    with pytest.raises(RuntimeError, match="en dehors de la mémoire"):
+        jit.interprete(asm, seuil=3)
+
+
+# Conventions d'appel : tous les compilateurs affichent la même chose que l'évaluation directe.
+
+def compare_compilateurs(prog):
+    resultats = evalue.compare(prog)
+    for nom, resultat in resultats.items():
+        assert resultat["sortie"] == resultats["direct"]["sortie"], nom
+
+@pytest.mark.parametrize("prog", [
+    # g modifie x, qui doit être lu avant l'appel
+    "x = 1 FONCTION g() x = 100 RENVOYER 0 FIN FONCTION f(a, b) RENVOYER a FIN AFFICHER(f(x, g()))",
+    "x = 1 FONCTION g() x = 100 RENVOYER 0 FIN FONCTION f(a, b) RENVOYER a + b FIN AFFICHER(f(g(), x))",
+    # arguments échangés entre registres
+    "FONCTION g(a, b) RENVOYER a * 10 + b FIN FONCTION f(a, b) RENVOYER g(b, a) + g(a, b) FIN AFFICHER(f(1, 2))",
+    "FONCTION h(x) RENVOYER x + 1 FIN FONCTION g(a, b) RENVOYER a * 10 + b FIN "
+    "FONCTION f(a, b) RENVOYER g(h(b), a) + g(b, h(a)) FIN AFFICHER(f(1, 2))",
+])
+def test_conventions_appel(prog):
+    compare_compilateurs(prog)
+
+
+# Portée des fonctions : une fonction déclarée dans une autre ne masque celle de même nom que dans ce corps.
+
+@pytest.mark.parametrize("prog", [
+    "FONCTION f() FONCTION f() RENVOYER 7 FIN RENVOYER f() FIN AFFICHER(f())",
+    "FONCTION f() FONCTION aide() RENVOYER 1 FIN RENVOYER aide() FIN "
+    "FONCTION g() FONCTION aide() RENVOYER 2 FIN RENVOYER aide() + f() FIN AFFICHER(g()) AFFICHER(f())",
+])
+def test_fonctions_masquees(prog):
+    compare_compilateurs(prog)
+
+
+def test_ssa_fonction_masquee():
+    # Après f, g désigne de nouveau la fonction globale, et non celle déclarée dans f.
+    ast = parser.parse("FONCTION g() RENVOYER 4 FIN FONCTION f() FONCTION g() RENVOYER 5 FIN RENVOYER g() FIN "
+                       "AFFICHER(g()) AFFICHER(f()) AFFICHER(g())")
+    attendu = sortie_de(evalue.evalue, ast)
+    assert attendu == "4\n5\n4\n"
+    assert sortie_de(interprete_asm.interprete, ssa.compile(ast)) == attendu
+
+
+# main.py
+
+def test_manifeste_absent(tmp_path, capsys):
+    with pytest.raises(SystemExit) as sortie:
+        main.main(["--manifeste", str(tmp_path / "absent.txt")])
+    assert sortie.value.code == 2
+    assert "manifeste illisible" in capsys.readouterr().err
+
+
+# objet.py
+
+@pytest.mark.parametrize("coupe", [1, objet.format_instr.size, objet.format_instr.size + 1])
+def test_objet_tronque(tmp_path, coupe):
+    chemin = tmp_path / "prog.o"
+    objet.compile_objet(parser.parse("FONCTION f(a) RENVOYER a + 1 FIN AFFICHER(f(1))"), str(chemin))
+    programme, entrees, _ = objet.charge_objet(str(chemin))
+    assert entrees
+    donnees = chemin.read_bytes()
+    # coupe dans la table des symboles, puis dans les instructions
+    for taille in (len(donnees) - coupe, objet.format_entete.size + len(programme) * objet.format_instr.size - coupe):
+        chemin.write_bytes(donnees[:taille])
+        with pytest.raises(RuntimeError, match="tronqué"):
+            objet.charge_objet(str(chemin))
+
+
+# serveur.py
+
+def test_libere_socket(tmp_path):
+    chemin = str(tmp_path / "s.sock")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as ecoute:
+        ecoute.bind(chemin)
+        ecoute.listen()
+        with pytest.raises(RuntimeError, match="écoute déjà"):
+            serveur.libere_socket(chemin)
+    serveur.libere_socket(chemin)  # plus personne n'écoute : socket abandonnée
+    assert not (tmp_path / "s.sock").exists()
+
+    fichier = tmp_path / "fichier"
+    fichier.write_text("à garder")
+    with pytest.raises(RuntimeError, match="pas une socket"):
+        serveur.libere_socket(str(fichier))
+    assert fichier.read_text() == "à garder"